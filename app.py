@@ -1,46 +1,203 @@
-from flask import Flask, request, jsonify, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask import Flask, Request, Response, g, request, jsonify, send_from_directory
+from flask_socketio import SocketIO, emit, join_room
 import json
+import re
 import os
 import uuid
 from datetime import datetime, timezone
 import threading
 import time
+import heapq
+import bisect
+import collections
+import base64
+import hashlib
+import atexit
+import signal
 from werkzeug.utils import secure_filename
-import sys # Import sys for logging
-import traceback # Import traceback to print detailed error info
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge
+import tempfile
+import shutil
+import subprocess
+try:
+    import mutagen # Optional: audio durations in GET /audio_files?details=1
+except ImportError:
+    mutagen = None
+import sys
+import copy
+import logging
+import logging.handlers
+import queue
+from storage import JournalStorage, create_storage, due_ms_from_time, normalize_reminder_time, reminder_due_timestamp, write_json_atomic
+from recurrence import advance_reminder, parse_recurrence
+from metrics import MetricsRegistry, StackSampler
 
-print("Script app.py started.") # Log start of script
 
 # --- Configuration ---
 # Define folders for audio files relative to the script's directory
 # Get the absolute path of the directory containing this script
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploaded_audio')
+UPLOAD_FOLDER = os.environ.get('ALARM_UPLOAD_DIR', os.path.join(BASE_DIR, 'uploaded_audio'))
+# Uploads in progress. Spool files of failed or deduplicated uploads come and go here without
+# changing the mtime of UPLOAD_FOLDER, which the audio library watches; being on the same
+# filesystem, finished uploads are still moved into place with os.replace.
+UPLOAD_SPOOL_FOLDER = os.path.join(UPLOAD_FOLDER, '.incoming')
+# Transcoded variants of uploads (and their temporary files), kept out of UPLOAD_FOLDER for the same reason
+UPLOAD_VARIANTS_FOLDER = os.path.join(UPLOAD_FOLDER, '.variants')
 DEFAULT_AUDIO_FOLDER = os.path.join(BASE_DIR, 'default_audio')
-DATA_FILE = os.path.join(BASE_DIR, 'reminders.json') # Data file in the base directory
+DATA_FILE = os.environ.get('ALARM_DATA_FILE', os.path.join(BASE_DIR, 'reminders.json')) # Data file in the base directory
+
+# Durability mode for reminders.json: 'write', 'interval' or 'shutdown' (see ReminderStore)
+PERSIST_MODES = ('write', 'interval', 'shutdown')
+PERSIST_MODE = os.environ.get('ALARM_PERSIST_MODE', 'interval')
+# Maximum delay between a change and its flush in 'interval' mode
+PERSIST_INTERVAL_MS = int(os.environ.get('ALARM_PERSIST_INTERVAL_MS', '500'))
+# Storage backend: 'journal' (append-only log next to reminders.json), 'json' (rewrite the whole file)
+# or 'sqlite' (indexed database, imports reminders.json on first use)
+STORAGE_BACKEND = os.environ.get('ALARM_STORAGE_BACKEND', 'journal')
+SQLITE_FILE = os.environ.get('ALARM_SQLITE_FILE', os.path.splitext(DATA_FILE)[0] + '.db')
+# Journal size after which it is folded back into reminders.json
+JOURNAL_COMPACT_BYTES = int(os.environ.get('ALARM_JOURNAL_COMPACT_BYTES', str(1024 * 1024)))
+
+# Number of reminder change events kept in memory for clients catching up after a reconnect
+CHANGE_LOG_SIZE = int(os.environ.get('ALARM_CHANGE_LOG_SIZE', '1000'))
+# How often GET /audio_files checks the audio folders for files changed outside the app (0 = never)
+AUDIO_RESCAN_INTERVAL_MS = int(os.environ.get('ALARM_AUDIO_RESCAN_INTERVAL_MS', '2000'))
+# Largest accepted audio upload in bytes (0 = no limit)
+MAX_UPLOAD_BYTES = int(os.environ.get('ALARM_MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+# Transcode uploads to a small fast-start AAC/MP4 variant with ffmpeg (ALARM_AUDIO_TRANSCODE=1, needs ffmpeg)
+AUDIO_TRANSCODE = os.environ.get('ALARM_AUDIO_TRANSCODE', '0') == '1'
+FFMPEG_PATH = shutil.which(os.environ.get('ALARM_FFMPEG', 'ffmpeg'))
+# What to do with reminders that became due while the server was down (or the checker was behind):
+#   'fire_all' - deliver every missed one, including every missed occurrence of recurring reminders
+#   'coalesce' - deliver each missed reminder once; a recurring one fires once for all missed occurrences
+#   'drop'     - don't deliver reminders overdue by more than MISFIRE_GRACE_MS (recurring ones skip ahead)
+MISFIRE_POLICIES = ('fire_all', 'coalesce', 'drop')
+MISFIRE_POLICY = os.environ.get('ALARM_MISFIRE_POLICY', 'coalesce')
+# Reminders at most this late are on time and always delivered
+MISFIRE_GRACE_MS = int(os.environ.get('ALARM_MISFIRE_GRACE_MS', '60000'))
+# The checker handles at most this many due reminders per round, and sends at most
+# DUE_EMIT_CHUNK_SIZE per 'reminder_due' frame, pausing DUE_EMIT_INTERVAL_MS between frames
+FIRE_BATCH_SIZE = int(os.environ.get('ALARM_FIRE_BATCH_SIZE', '1000'))
+DUE_EMIT_CHUNK_SIZE = int(os.environ.get('ALARM_DUE_EMIT_CHUNK_SIZE', '100'))
+DUE_EMIT_INTERVAL_MS = int(os.environ.get('ALARM_DUE_EMIT_INTERVAL_MS', '20'))
+# Delivered reminders stay in flight until a client acknowledges them; unacknowledged ones
+# are sent again after DELIVERY_RETRY_BASE_MS, doubling up to DELIVERY_RETRY_MAX_MS, and
+# given up after DELIVERY_MAX_ATTEMPTS deliveries to a connected client, DELIVERY_MAX_AGE_MS
+# after they fired, or (oldest first) once more than DELIVERY_QUEUE_MAX_SIZE are in flight.
+# The queue is snapshotted in DELIVERY_QUEUE_FILE, with a journal of changes next to it.
+DELIVERY_QUEUE_FILE = os.environ.get('ALARM_DELIVERY_QUEUE_FILE', os.path.splitext(DATA_FILE)[0] + '.inflight.json')
+DELIVERY_RETRY_BASE_MS = int(os.environ.get('ALARM_DELIVERY_RETRY_BASE_MS', '5000'))
+DELIVERY_RETRY_MAX_MS = int(os.environ.get('ALARM_DELIVERY_RETRY_MAX_MS', '300000'))
+DELIVERY_MAX_ATTEMPTS = int(os.environ.get('ALARM_DELIVERY_MAX_ATTEMPTS', '10'))
+DELIVERY_MAX_AGE_MS = int(os.environ.get('ALARM_DELIVERY_MAX_AGE_MS', str(24 * 60 * 60 * 1000)))
+DELIVERY_QUEUE_MAX_SIZE = int(os.environ.get('ALARM_DELIVERY_QUEUE_MAX_SIZE', '10000'))
 
 # Define a default audio filename (ensure this file exists in DEFAULT_AUDIO_FOLDER)
 DEFAULT_AUDIO_FILENAME = 'default_beep.mp3'
 
-print(f"Script app.py started. Base directory: {BASE_DIR}")
-print(f"UPLOAD_FOLDER: {UPLOAD_FOLDER}")
-print(f"DEFAULT_AUDIO_FOLDER: {DEFAULT_AUDIO_FOLDER}")
-print(f"DATA_FILE: {DATA_FILE}")
+# Logging: level (DEBUG shows per-request/per-tick detail), 'json' or 'text' lines, and werkzeug access log on/off
+LOG_LEVEL = os.environ.get('ALARM_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('ALARM_LOG_FORMAT', 'text')
+ACCESS_LOG = os.environ.get('ALARM_ACCESS_LOG', '0') == '1'
+# Run with the Flask debugger and reloader (ALARM_DEBUG=1, development only: the reloader
+# runs the server in a child process, which is not shut down cleanly when the parent is signalled)
+DEBUG = os.environ.get('ALARM_DEBUG', '0') == '1'
+# Enable POST /debug/profile, which samples the stacks of the running server (ALARM_PROFILING=1).
+# It can also be enabled while the server runs by creating PROFILING_FLAG_FILE, which is
+# checked on every request (and disabled again by removing it).
+PROFILING_ENABLED = os.environ.get('ALARM_PROFILING', '0') == '1'
+PROFILING_FLAG_FILE = os.environ.get('ALARM_PROFILING_FLAG_FILE', os.path.join(os.path.dirname(DATA_FILE), 'profiling.enabled'))
+
+
+# --- Logging ---
+# Log records are handed to a queue and written to stdout/stderr by a listener thread,
+# so request handlers and the checker never block on console I/O.
+_LOG_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        # Fields passed through extra={...} become top-level keys
+        for key, value in vars(record).items():
+            if key not in _LOG_RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class _LogQueueHandler(logging.handlers.QueueHandler):
+    # Unlike the stock QueueHandler, keep exc_text separate from msg so the JSON
+    # formatter can put the traceback in its own field.
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+def configure_logging():
+    if LOG_FORMAT == 'json':
+        formatter = JsonLogFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+    # Errors and warnings go to stderr (the Electron shell watches it for startup failures), the rest to stdout
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setFormatter(formatter)
+    stdout_handler.addFilter(lambda record: record.levelno < logging.WARNING)
+    stderr_handler = logging.StreamHandler(sys.stderr)
+    stderr_handler.setFormatter(formatter)
+    stderr_handler.setLevel(logging.WARNING)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stdout_handler, stderr_handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers[:] = [_LogQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL if isinstance(logging.getLevelName(LOG_LEVEL), int) else logging.INFO)
+    # werkzeug logs every request at INFO; only let it through when the access log is on
+    logging.getLogger('werkzeug').setLevel(logging.INFO if ACCESS_LOG else logging.WARNING)
+    listener.start()
+    atexit.register(listener.stop)
+
+configure_logging()
+logger = logging.getLogger('alarm')
+
+logger.info("Script app.py started. Base directory: %s", BASE_DIR)
+logger.info("UPLOAD_FOLDER: %s", UPLOAD_FOLDER)
+logger.info("DEFAULT_AUDIO_FOLDER: %s", DEFAULT_AUDIO_FOLDER)
+logger.info("DATA_FILE: %s", DATA_FILE)
+logger.info("PERSIST_MODE: %s (interval %s ms)", PERSIST_MODE, PERSIST_INTERVAL_MS)
+logger.info("STORAGE_BACKEND: %s", STORAGE_BACKEND)
+if STORAGE_BACKEND == 'sqlite':
+    logger.info("SQLITE_FILE: %s", SQLITE_FILE)
+if MISFIRE_POLICY not in MISFIRE_POLICIES:
+    logger.warning("Unknown misfire policy '%s'. Falling back to 'coalesce'.", MISFIRE_POLICY)
+    MISFIRE_POLICY = 'coalesce'
+logger.info("MISFIRE_POLICY: %s (grace %s ms)", MISFIRE_POLICY, MISFIRE_GRACE_MS)
+if AUDIO_TRANSCODE and not FFMPEG_PATH:
+    logger.warning("ALARM_AUDIO_TRANSCODE is set but ffmpeg was not found. Uploads are served as is.")
+    AUDIO_TRANSCODE = False
 
 
 # Ensure audio folders exist
 try:
-    print(f"Ensuring existence of folders: {UPLOAD_FOLDER}, {DEFAULT_AUDIO_FOLDER}")
+    logger.info("Ensuring existence of folders: %s, %s", UPLOAD_FOLDER, DEFAULT_AUDIO_FOLDER)
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(UPLOAD_SPOOL_FOLDER, exist_ok=True)
+    os.makedirs(UPLOAD_VARIANTS_FOLDER, exist_ok=True)
     os.makedirs(DEFAULT_AUDIO_FOLDER, exist_ok=True)
-    print(f"Folders checked/created successfully.")
+    logger.info("Folders checked/created successfully.")
 except OSError as e:
-    print(f"Error creating folders: {e}", file=sys.stderr)
-    traceback.print_exc(file=sys.stderr) # Print traceback for folder creation error
+    logger.exception("Error creating folders: %s", e)
     sys.exit(1) # Exit if folders cannot be created
 
-print("Configuring Flask...")
+logger.info("Configuring Flask...")
 # Configure Flask
 # static_folder='' and static_url_path='' serve files from BASE_DIR
 # This tells Flask to look for static files (like index.html) in the BASE_DIR
@@ -49,7 +206,7 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['DEFAULT_AUDIO_FOLDER'] = DEFAULT_AUDIO_FOLDER
 
 
-print("Configuring SocketIO...")
+logger.info("Configuring SocketIO...")
 # Configure SocketIO - cors_allowed_origins="*" allows connections from any origin
 # In a production environment, you should restrict this to your frontend's origin(s)
 # Using gevent as the async mode, which is compatible with Flask-SocketIO
@@ -57,422 +214,2286 @@ try:
     # Note: async_mode='gevent' requires gevent and gevent-websocket to be installed
     # If you encounter issues, you can remove async_mode or try 'threading'
     socketio = SocketIO(app, cors_allowed_origins="*", async_mode='gevent')
-    print("SocketIO configured successfully with async_mode='gevent'.")
+    logger.info("SocketIO configured successfully with async_mode='gevent'.")
 except Exception as e:
-    print(f"Error configuring SocketIO with gevent: {e}", file=sys.stderr)
-    print("Falling back to threading async mode. Install gevent and gevent-websocket for better performance.", file=sys.stderr)
-    traceback.print_exc(file=sys.stderr)
+    logger.warning("Could not configure SocketIO with gevent (%s). Falling back to threading async mode. Install gevent and gevent-websocket for better performance.", e)
     # Fallback to threading async mode if gevent fails
     socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
 
+# --- Metrics ---
+# Prometheus metrics, served by GET /metrics (see metrics.py). Gauges that read the
+# current state of an object (store size, connected clients, ...) are registered
+# right after the object is created.
+metrics_registry = MetricsRegistry()
+HTTP_REQUEST_SECONDS = metrics_registry.histogram(
+    'alarm_http_request_duration_seconds', 'HTTP request latency by route.', ('method', 'route', 'status'))
+CHECKER_ROUND_SECONDS = metrics_registry.histogram(
+    'alarm_checker_round_duration_seconds', 'Time the checker takes to fire one round of due reminders.')
+REMINDER_FIRE_LAG_SECONDS = metrics_registry.histogram(
+    'alarm_reminder_fire_lag_seconds', 'Time between the due time of a reminder and when the checker fired it.',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 30.0, 60.0, 300.0, 3600.0, 86400.0))
+REMINDERS_FIRED = metrics_registry.counter('alarm_reminders_fired_total', 'Reminders fired by the checker.')
+STORE_FLUSH_SECONDS = metrics_registry.histogram(
+    'alarm_store_flush_duration_seconds', 'Time to write a batch of changes to the storage backend.')
+STORE_FLUSH_CHANGES = metrics_registry.histogram(
+    'alarm_store_flush_changes', 'Changes written per storage flush.', buckets=(1, 10, 100, 1000, 10000, 100000))
+STORE_FLUSH_FAILURES = metrics_registry.counter('alarm_store_flush_failures_total', 'Failed storage flushes.')
+DUE_EMIT_FRAME_REMINDERS = metrics_registry.histogram(
+    'alarm_due_emit_frame_reminders', "Reminders per 'reminder_due' frame.", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+CHANGE_EVENTS = metrics_registry.counter('alarm_change_events_total', 'Change feed events published.', ('event',))
+DELIVERY_ACK_SECONDS = metrics_registry.histogram(
+    'alarm_delivery_ack_latency_seconds', 'Time between the first delivery of a reminder and its acknowledgement.',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 30.0, 60.0, 300.0, 3600.0))
+
+
+# Time every request; the route pattern (not the URL) keeps the number of label sets small
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route,
+                                     status=response.status_code)
+    return response
+
+
 # --- Data Loading and Saving ---
-# Function to load reminders from the file
+# Reminders are persisted through a pluggable storage backend (see storage.py)
+logger.info("Configuring '%s' storage backend...", STORAGE_BACKEND)
+try:
+    storage_backend = create_storage(STORAGE_BACKEND, DATA_FILE, JOURNAL_COMPACT_BYTES,
+                                     sqlite_file=SQLITE_FILE, due_key=reminder_due_timestamp)
+except ValueError as e:
+    logger.error("Error configuring storage backend: %s", e)
+    sys.exit(1) # Exit if the configured backend is unknown
+
+
+# Function to load reminders from the storage backend
 def load_reminders():
-    print(f"Attempting to load reminders from {DATA_FILE}")
-    if not os.path.exists(DATA_FILE):
-        print(f"Data file not found: {DATA_FILE}. Returning empty list.")
-        return []
     try:
-        # Open and read the data file with utf-8 encoding
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            # Load JSON data from the file
-            reminders = json.load(f)
-            print(f"Loaded {len(reminders)} reminders from {DATA_FILE}")
-            return reminders
-    except json.JSONDecodeError:
-        print(f"Error decoding JSON from {DATA_FILE}. File might be corrupt. Returning empty list.", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
-        return []
-    except IOError as e:
-        print(f"Error reading data file {DATA_FILE}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
-        return []
+        return storage_backend.load()
     except Exception as e:
-        print(f"Unexpected error loading reminders from {DATA_FILE}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        logger.exception("Unexpected error loading reminders from %s storage: %s", storage_backend.name, e)
         return []
 
 
-# Function to save reminders to the file
+# Function to replace all stored reminders with the given list
+# Returns True if the reminders were written successfully.
 def save_reminders(reminders):
-    print(f"Attempting to save {len(reminders)} reminders to {DATA_FILE}")
     try:
-        # Sort reminders by time before saving for consistent order
-        reminders.sort(key=lambda r: r.get('time', ''))
-        # Open the data file for writing with utf-8 encoding
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            # Dump the reminders list as JSON to the file, with indentation for readability
-            json.dump(reminders, f, indent=4, ensure_ascii=False) # ensure_ascii=False to save non-ASCII chars directly
-        print(f"Saved {len(reminders)} reminders to {DATA_FILE}")
+        storage_backend.save(reminders)
+        return True
     except IOError as e:
-        print(f"Error saving reminders to file {DATA_FILE}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        logger.exception("Error saving reminders to %s storage: %s", storage_backend.name, e)
     except Exception as e:
-        print(f"Unexpected error saving reminders to {DATA_FILE}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        logger.exception("Unexpected error saving reminders to %s storage: %s", storage_backend.name, e)
+    return False
+
+
+# Function to persist a batch of changes (see storage.py for the change format)
+# snapshot is a callable returning the full list, for backends that rewrite everything.
+# Returns True if the changes were written successfully.
+def write_reminder_changes(changes, snapshot):
+    try:
+        storage_backend.write(changes, snapshot)
+        return True
+    except IOError as e:
+        logger.exception("Error writing %s reminder changes to %s storage: %s", len(changes), storage_backend.name, e)
+    except Exception as e:
+        logger.exception("Unexpected error writing reminder changes to %s storage: %s", storage_backend.name, e)
+    return False
+
+
+# Sort key ordering reminders by due time; reminders with an invalid time go last
+def reminder_sort_key(reminder):
+    due_utc_ms = reminder.get('due_utc_ms')
+    return (due_utc_ms is None, due_utc_ms or 0, reminder.get('id', ''))
+
+
+# --- Reminder Store ---
+# Authoritative in-process store for reminders, indexed by id.
+# The storage backend is read once at startup; afterwards all routes and the checker
+# work on this store and changes are handed to the backend by a write-behind flusher.
+# PERSIST_MODE controls the trade-off between latency and crash safety:
+#   'write'    - flush synchronously after every change (safest, slowest)
+#   'interval' - coalesce changes and flush at most every PERSIST_INTERVAL_MS
+#   'shutdown' - only flush when the process exits
+class ReminderStore:
+    def __init__(self, persist_mode='interval', persist_interval_ms=500):
+        if persist_mode not in PERSIST_MODES:
+            logger.warning("Unknown persist mode '%s'. Falling back to 'interval'.", persist_mode)
+            persist_mode = 'interval'
+        self.persist_mode = persist_mode
+        self.persist_interval = persist_interval_ms / 1000.0
+        self.version = 0 # Incremented on every change
+        # Random per-process token, so versions from before a restart are never mistaken for current ones
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._reminders = {} # reminder_id -> reminder dict
+        self._order = [] # reminder_sort_key of every reminder, kept sorted (ordered index by due time)
+        self._lock = threading.RLock()
+        self._pending = [] # Changes not yet handed to the storage backend
+        self._pending_since = None # time.monotonic() of the oldest pending change
+        self._flush_lock = threading.Lock()
+        self._flusher_started = False
+        self._flush_requested = None # Created lazily with the async event class SocketIO uses
+        self._compaction_running = False
+
+    # Load reminders from the storage backend (called once at startup)
+    def load(self):
+        reminders = load_reminders()
+        needs_full_save = False
+        with self._lock:
+            self._reminders = {}
+            for reminder in reminders:
+                reminder_id = reminder.get('id')
+                if not reminder_id:
+                    # Give legacy records without an id one, so they can be addressed
+                    reminder_id = str(uuid.uuid4())
+                    reminder['id'] = reminder_id
+                    needs_full_save = True
+                # Migrate legacy records to carry a pre-parsed UTC due time
+                if normalize_reminder_time(reminder):
+                    needs_full_save = True
+                self._reminders[reminder_id] = reminder
+            self._order = sorted(reminder_sort_key(r) for r in self._reminders.values())
+            self.version += 1
+        if needs_full_save:
+            # Rewrite everything once, so migrated records are not migrated again on the next start
+            save_reminders(list(self._reminders.values()))
+        logger.info("Reminder store loaded with %s reminders.", len(self._reminders))
+
+    # Return a list of all reminders, ordered by time
+    def list(self):
+        with self._lock:
+            return [self._reminders[key[2]] for key in self._order]
+
+    # Walk the due time index and return (reminders, next_key).
+    # after_key    - continue after this sort key (from a previous page)
+    # due_after_ms - only reminders due at or after this time
+    # due_before_ms - only reminders due strictly before this time
+    # predicate    - optional extra filter applied to each reminder
+    # limit        - maximum number of reminders; next_key is the sort key to continue
+    #                after if more matches exist, otherwise None
+    def query(self, after_key=None, due_after_ms=None, due_before_ms=None, predicate=None, limit=None):
+        results = []
+        next_key = None
+        with self._lock:
+            start = 0
+            if after_key is not None:
+                start = bisect.bisect_right(self._order, after_key)
+            if due_after_ms is not None:
+                start = max(start, bisect.bisect_left(self._order, (False, due_after_ms, '')))
+            for index in range(start, len(self._order)):
+                key = self._order[index]
+                if due_before_ms is not None and (key[0] or key[1] >= due_before_ms):
+                    break # The index is ordered, nothing after this can match
+                reminder = self._reminders[key[2]]
+                if predicate is not None and not predicate(reminder):
+                    continue
+                if limit is not None and len(results) == limit:
+                    next_key = reminder_sort_key(results[-1])
+                    break
+                results.append(reminder)
+        return results, next_key
+
+    def get(self, reminder_id):
+        with self._lock:
+            return self._reminders.get(reminder_id)
+
+    def add(self, reminder):
+        self.add_many([reminder])
+
+    # Add (or replace) several reminders at once; persisted as one batch
+    def add_many(self, reminders):
+        if not reminders:
+            return
+        with self._lock:
+            for reminder in reminders:
+                previous = self._reminders.get(reminder['id'])
+                if previous is not None:
+                    self._remove_from_order(previous)
+                self._reminders[reminder['id']] = reminder
+                bisect.insort(self._order, reminder_sort_key(reminder))
+                self._changed(('add', reminder))
+        self._persist()
+
+    # Remove a reminder by id and return it (None if it does not exist)
+    def delete(self, reminder_id):
+        removed, _ = self.delete_many([reminder_id])
+        return removed[0] if removed else None
+
+    # Remove several reminders at once; persisted as one batch.
+    # Returns (removed, missing_ids). With require_all, nothing is removed if any id is missing.
+    def delete_many(self, reminder_ids, require_all=False):
+        removed = []
+        with self._lock:
+            missing_ids = [reminder_id for reminder_id in reminder_ids if reminder_id not in self._reminders]
+            if missing_ids and require_all:
+                return [], missing_ids
+            for reminder_id in reminder_ids:
+                reminder = self._reminders.pop(reminder_id, None)
+                if reminder is not None:
+                    self._remove_from_order(reminder)
+                    self._changed(('delete', reminder_id))
+                    removed.append(reminder)
+        if removed:
+            self._persist()
+        return removed, missing_ids
+
+    # Handle reminders that were delivered by the checker: one-shot reminders are removed
+    # (one change for the whole batch), recurring ones move to their next occurrence after
+    # now_ms (see recurrence.py) or are removed when their series has ended. Without
+    # skip_missed they move to the occurrence right after the one that fired, even if that
+    # is already past (so every missed occurrence fires).
+    # before_commit(fired), if given, is called with the reminders about to fire under the
+    # store lock, before anything changes or is persisted (see DeliveryQueue.enqueue).
+    # Returns (fired, rescheduled): the reminders as they were when due, and the updated
+    # records of the recurring ones that stay.
+    def mark_fired(self, reminder_ids, now_ms, skip_missed=True, before_commit=None):
+        rescheduled = []
+        with self._lock:
+            fired = [self._reminders[reminder_id] for reminder_id in dict.fromkeys(reminder_ids)
+                     if reminder_id in self._reminders]
+            if fired and before_commit is not None:
+                before_commit(fired)
+            for reminder in fired:
+                reminder_id = reminder['id']
+                # Take the old due time out of the index before the record changes
+                self._remove_from_order(reminder)
+                next_reminder = None
+                if reminder.get('recurrence'):
+                    next_reminder = advance_reminder(reminder, now_ms if skip_missed else reminder['due_utc_ms'])
+                if next_reminder is None:
+                    del self._reminders[reminder_id]
+                    continue
+                self._reminders[reminder_id] = next_reminder
+                bisect.insort(self._order, reminder_sort_key(next_reminder))
+                rescheduled.append(next_reminder)
+            rescheduled_ids = {r['id'] for r in rescheduled}
+            removed_ids = [r['id'] for r in fired if r['id'] not in rescheduled_ids]
+            if removed_ids:
+                self._changed(('fired', removed_ids))
+            for reminder in rescheduled:
+                self._changed(('add', reminder))
+        if fired:
+            self._persist()
+        return fired, rescheduled
+
+    def __len__(self):
+        with self._lock:
+            return len(self._reminders)
+
+    # Number of changes not yet on disk, and how long the oldest of them has waited (seconds)
+    def pending_changes(self):
+        with self._lock:
+            return len(self._pending)
+
+    def pending_age(self):
+        with self._lock:
+            if self._pending_since is None:
+                return 0
+            return time.monotonic() - self._pending_since
+
+    # Hand pending changes to the storage backend
+    def flush(self):
+        # Serialize flushes so changes reach the backend in order
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                changes = self._pending
+                pending_since = self._pending_since
+                self._pending = []
+                self._pending_since = None
+            start = time.perf_counter()
+            if not write_reminder_changes(changes, self._snapshot):
+                STORE_FLUSH_FAILURES.inc()
+                # Keep the changes pending so the next flush retries them
+                with self._lock:
+                    self._pending = changes + self._pending
+                    self._pending_since = pending_since
+                return False
+            STORE_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            STORE_FLUSH_CHANGES.observe(len(changes))
+        if storage_backend.needs_compaction():
+            self._request_compaction()
+        return True
+
+    # Fold the backend's accumulated changes into a fresh snapshot
+    def compact(self):
+        # Hold the flush lock so no batch is written while the snapshot replaces the journal.
+        # Changes still pending are part of the snapshot and will be written again after it,
+        # which is harmless because replaying them is idempotent.
+        with self._flush_lock:
+            try:
+                storage_backend.compact(self._snapshot)
+            except Exception as e:
+                logger.exception("Error compacting %s storage: %s", storage_backend.name, e)
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._reminders.values())
+
+    def _remove_from_order(self, reminder):
+        # Caller holds self._lock
+        key = reminder_sort_key(reminder)
+        index = bisect.bisect_left(self._order, key)
+        if index < len(self._order) and self._order[index] == key:
+            del self._order[index]
+
+    def _changed(self, change):
+        # Caller holds self._lock
+        self.version += 1
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending.append(change)
+
+    # Persist a change according to the durability mode (called without self._lock held)
+    def _persist(self):
+        if self.persist_mode == 'write':
+            self.flush()
+        elif self.persist_mode == 'interval':
+            self._request_flush()
+
+    def _request_flush(self):
+        with self._lock:
+            if self._flush_requested is None:
+                self._flush_requested = socketio.server.eio.create_event()
+            start_flusher = not self._flusher_started
+            self._flusher_started = True
+        if start_flusher:
+            socketio.start_background_task(target=self._flusher_task)
+        self._flush_requested.set()
+
+    # Run compaction as a background task so it never blocks a request or the checker
+    def _request_compaction(self):
+        with self._lock:
+            if self._compaction_running:
+                return
+            self._compaction_running = True
+        socketio.start_background_task(target=self._compaction_task)
+
+    def _compaction_task(self):
+        try:
+            self.compact()
+        finally:
+            with self._lock:
+                self._compaction_running = False
+
+    # Background task that coalesces changes into at most one flush per interval
+    def _flusher_task(self):
+        logger.info("Reminder store flusher started (interval %.0f ms).", self.persist_interval * 1000)
+        while True:
+            self._flush_requested.wait()
+            self._flush_requested.clear()
+            # Give further changes a chance to pile up before writing
+            socketio.sleep(self.persist_interval)
+            try:
+                if not self.flush():
+                    self._flush_requested.set() # Retry on the next interval
+            except Exception as e:
+                logger.exception("Unexpected error in reminder store flusher: %s", e)
+
+    # Flush pending changes and release the backend (called on interpreter exit)
+    def close(self):
+        self.flush()
+        storage_backend.close()
+
+
+reminder_store = ReminderStore(PERSIST_MODE, PERSIST_INTERVAL_MS)
+reminder_store.load()
+# Flush pending changes on interpreter exit (covers all persist modes)
+atexit.register(reminder_store.close)
+metrics_registry.gauge('alarm_reminders', 'Reminders in the store.', func=lambda: len(reminder_store))
+metrics_registry.gauge('alarm_store_unflushed_changes', 'Changes not yet written to the storage backend.',
+                       func=reminder_store.pending_changes)
+metrics_registry.gauge('alarm_store_unflushed_age_seconds', 'How long the oldest change not yet written has waited.',
+                       func=reminder_store.pending_age)
+
+
+# Current wall clock time as UTC epoch milliseconds (the unit of 'due_utc_ms')
+def current_time_ms():
+    return int(time.time() * 1000)
+
+
+# Lets a background task sleep until a timeout or until another task calls set().
+# Used by the checker and the delivery retry task, which sleep until their next deadline
+# but must wake up early when an earlier one is added.
+class WakeupSignal:
+    def __init__(self, max_sleep_seconds):
+        # Upper bound for a single sleep, so wall clock adjustments are picked up eventually
+        self.max_sleep_seconds = max_sleep_seconds
+        self._event = None # Created lazily with the async event class SocketIO uses
+
+    def _get_event(self):
+        if self._event is None:
+            # Use the event class matching socketio's async mode (gevent or threading)
+            self._event = socketio.server.eio.create_event()
+        return self._event
+
+    def set(self):
+        self._get_event().set()
+
+    # Block for timeout seconds (None: the maximum) or until set() is called
+    def wait(self, timeout):
+        if timeout is None or timeout > self.max_sleep_seconds:
+            timeout = self.max_sleep_seconds
+        event = self._get_event()
+        event.wait(timeout)
+        event.clear()
+
+
+# --- Scheduler ---
+# In-memory timer scheduler for pending reminders.
+# Reminders are kept in a min-heap keyed by their due time (UTC epoch milliseconds), so the
+# checker can sleep until the earliest deadline instead of re-reading reminders.json
+# every second. add_reminder/delete_reminder update the heap and wake the checker
+# when the earliest deadline changes.
+class ReminderScheduler:
+    # Upper bound for a single sleep, so wall clock adjustments are picked up eventually
+    MAX_SLEEP_SECONDS = 60
+
+    def __init__(self):
+        self._heap = [] # Entries are (due_utc_ms, reminder_id)
+        self._due_by_id = {} # reminder_id -> due_utc_ms currently scheduled
+        self._lock = threading.Lock()
+        self._wakeup = WakeupSignal(self.MAX_SLEEP_SECONDS)
+
+    # Replace all scheduled entries with the given list of reminders
+    def rebuild(self, reminders):
+        heap = []
+        due_by_id = {}
+        for reminder in reminders:
+            # Times were normalized when the reminder was stored; invalid ones were reported then
+            due_utc_ms = reminder.get('due_utc_ms')
+            if due_utc_ms is None:
+                continue
+            heap.append((due_utc_ms, reminder['id']))
+            due_by_id[reminder['id']] = due_utc_ms
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+            self._due_by_id = due_by_id
+        self._wakeup.set()
+        logger.info("Scheduler rebuilt with %s pending reminders.", len(heap))
+
+    # Schedule (or reschedule) a reminder; wakes the checker if it is the new earliest deadline
+    def schedule(self, reminder_id, due_utc_ms):
+        with self._lock:
+            self._due_by_id[reminder_id] = due_utc_ms
+            heapq.heappush(self._heap, (due_utc_ms, reminder_id))
+            is_earliest = self._heap[0] == (due_utc_ms, reminder_id)
+        if is_earliest:
+            self._wakeup.set()
+
+    # Remove a reminder from the schedule. Its heap entry is discarded lazily when popped.
+    def unschedule(self, reminder_id):
+        with self._lock:
+            self._due_by_id.pop(reminder_id, None)
+
+    # Seconds until the earliest live deadline, or None if nothing is scheduled
+    def seconds_until_next(self, now_ms):
+        with self._lock:
+            self._discard_stale_head()
+            if not self._heap:
+                return None
+            return max(0, self._heap[0][0] - now_ms) / 1000.0
+
+    # Pop and return the ids of reminders due at or before now_ms, earliest first (at most limit)
+    def pop_due(self, now_ms, limit=None):
+        due_ids = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now_ms and (limit is None or len(due_ids) < limit):
+                due_utc_ms, reminder_id = heapq.heappop(self._heap)
+                if self._due_by_id.get(reminder_id) == due_utc_ms:
+                    del self._due_by_id[reminder_id]
+                    due_ids.append(reminder_id)
+        return due_ids
+
+    # Block until the next deadline passes or the schedule changes
+    def wait(self, timeout):
+        self._wakeup.wait(timeout)
+
+    def _discard_stale_head(self):
+        # Drop heap entries for reminders that were deleted or rescheduled (caller holds the lock)
+        while self._heap and self._due_by_id.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._due_by_id)
+
+
+reminder_scheduler = ReminderScheduler()
+metrics_registry.gauge('alarm_scheduler_pending', 'Reminders scheduled to fire.', func=lambda: len(reminder_scheduler))
+
+
+# --- Channels ---
+# Every reminder belongs to a channel (an owner key chosen by the client, 'default'
+# if none). Each connected socket joins the room of its channel, so reminder events
+# are only sent to the clients that own the reminder instead of to every socket.
+DEFAULT_CHANNEL = 'default'
+CHANNEL_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+connected_channels = {} # socket sid -> channel
+metrics_registry.gauge('alarm_socketio_connected_clients', 'Connected Socket.IO clients.', func=lambda: len(connected_channels))
+
+
+# Function to validate a channel name supplied by a client (falls back to DEFAULT_CHANNEL)
+def normalize_channel(channel):
+    if isinstance(channel, str) and CHANNEL_NAME_PATTERN.match(channel):
+        return channel
+    return DEFAULT_CHANNEL
+
+
+def reminder_channel(reminder):
+    return reminder.get('channel') or DEFAULT_CHANNEL
+
+
+def channel_room(channel):
+    return 'channel:' + channel
+
+
+# Send due reminders to the owners' rooms only: one emit per channel involved,
+# so the cost is O(recipients) rather than O(all sockets x all due reminders).
+# A channel with a backlog gets several frames of at most DUE_EMIT_CHUNK_SIZE reminders,
+# with a short pause between its frames, instead of one huge frame.
+# With to (a socket sid), everything is sent to that one client instead.
+def emit_due_reminders(due_reminders, to=None):
+    by_channel = collections.defaultdict(list)
+    for reminder in due_reminders:
+        by_channel[reminder_channel(reminder)].append(reminder)
+    for channel, reminders in by_channel.items():
+        for start in range(0, len(reminders), DUE_EMIT_CHUNK_SIZE):
+            if start and DUE_EMIT_INTERVAL_MS > 0:
+                socketio.sleep(DUE_EMIT_INTERVAL_MS / 1000.0)
+            # We send the full reminder object, which includes 'audio_filename' and 'audio_type'
+            chunk = reminders[start:start + DUE_EMIT_CHUNK_SIZE]
+            DUE_EMIT_FRAME_REMINDERS.observe(len(chunk))
+            socketio.emit('reminder_due', chunk, to=to or channel_room(channel))
+    return by_channel
+
+
+# --- Change Feed ---
+# Sends every change to the reminder list as a small delta event with a
+# monotonically increasing sequence number, so clients can keep their copy up to
+# date without re-fetching /reminders. Sequence numbers and the log of the last
+# CHANGE_LOG_SIZE deltas are kept per channel, and deltas are only emitted to
+# that channel's room. A reconnecting client sends 'sync' with the last seq it saw
+# and receives only what it missed (or the full list if it fell too far behind).
+# Events:
+#   reminder_added   {seq, reminder}
+#   reminder_updated {seq, reminder}  - e.g. a recurring reminder moved to its next occurrence
+#   reminders_added  {seq, reminders} - a batch (POST /reminders:batch, imports)
+#   reminder_deleted {seq, id}
+#   reminders_deleted {seq, ids}      - a batch (DELETE /reminders:batch)
+#   reminders_fired  {seq, ids}
+class ChangeFeed:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._seqs = collections.defaultdict(int) # channel -> last seq
+        self._logs = {} # channel -> deque of (seq, event, payload)
+        self._lock = threading.Lock()
+
+    def seq(self, channel):
+        with self._lock:
+            return self._seqs[channel]
+
+    # Record a change and send it to the clients of the channel
+    def publish(self, channel, event, payload):
+        with self._lock:
+            self._seqs[channel] += 1
+            seq = self._seqs[channel]
+            payload = dict(payload, seq=seq)
+            log = self._logs.get(channel)
+            if log is None:
+                log = self._logs[channel] = collections.deque(maxlen=self.max_entries)
+            log.append((seq, event, payload))
+        CHANGE_EVENTS.inc(event=event)
+        socketio.emit(event, payload, to=channel_room(channel))
+        return seq
+
+    # Return the channel's changes after since_seq, or None if they are no longer all in the log
+    def changes_since(self, channel, since_seq):
+        with self._lock:
+            current_seq = self._seqs[channel]
+            if since_seq > current_seq:
+                return None # Seq from an earlier server run
+            if since_seq == current_seq:
+                return current_seq, []
+            log = self._logs.get(channel)
+            if not log or log[0][0] > since_seq + 1:
+                return None
+            changes = [{'event': event, 'data': payload} for seq, event, payload in log if seq > since_seq]
+            return current_seq, changes
+
+    # Return (seq, reminders) of a channel for a full resync
+    def snapshot(self, channel):
+        # Hold the lock so no change is published between reading the list and the seq.
+        # A change already applied to the store but not yet published is included in the
+        # list and its delta arrives afterwards, which clients apply idempotently.
+        with self._lock:
+            reminders, _ = reminder_store.query(predicate=lambda r: reminder_channel(r) == channel)
+            return self._seqs[channel], reminders
+
+
+change_feed = ChangeFeed(CHANGE_LOG_SIZE)
+
+
+# --- Delivery Queue ---
+# At-least-once delivery of due reminders. Every delivered reminder carries a 'delivery_id'
+# (reminder id + due time, so each occurrence of a recurring reminder is a separate
+# delivery) and stays in flight until a client of its channel acknowledges it with the
+# 'ack_reminders' event. Unacknowledged deliveries are sent again with exponential backoff
+# and given up after DELIVERY_MAX_ATTEMPTS. Attempts only count while a client of the
+# channel is connected; a client that connects gets the pending deliveries of its channel.
+# Deliveries are also given up DELIVERY_MAX_AGE_MS after they fired, and the oldest ones
+# once more than DELIVERY_QUEUE_MAX_SIZE are in flight, so channels whose clients never
+# come back don't grow the queue without bound.
+# A delivery holds a reference to its uploaded audio file until it leaves the queue, so
+# the file is still there when the alarm is redelivered.
+# The queue is stored like the reminders in the journal backend (see storage.py): the
+# entries, keyed by delivery id, are snapshotted in DELIVERY_QUEUE_FILE and every change is
+# appended to a journal next to it, so deliveries survive a restart. Clients can therefore
+# receive a reminder more than once and ignore delivery_ids they already showed.
+class DeliveryQueue:
+    # Number of recent ack latencies kept for the percentiles in stats()
+    LATENCY_SAMPLES = 1000
+    # Upper bound for a single sleep of the retry task
+    MAX_SLEEP_SECONDS = 60
+
+    def __init__(self, queue_file):
+        self.storage = JournalStorage(queue_file, compact_threshold_bytes=JOURNAL_COMPACT_BYTES)
+        # delivery_id -> {'id', 'reminder', 'attempts', 'queued_ms', 'first_sent_ms', 'next_retry_ms'},
+        # oldest first
+        self._entries = {}
+        self._by_channel = {} # channel -> {delivery_id: entry}
+        self._retry_heap = [] # (next_retry_ms, delivery_id); stale entries are discarded when popped
+        self._waiting = set() # Ids of deliveries never sent: no client of the channel was connected
+        self._changes = {} # delivery_id -> entry (or None if removed) not saved yet
+        self._lock = threading.RLock()
+        self._wakeup = WakeupSignal(self.MAX_SLEEP_SECONDS)
+        self._ack_latencies = collections.deque(maxlen=self.LATENCY_SAMPLES)
+        self.counters = collections.Counter() # delivered, redelivered, acked, expired
+
+    @property
+    def dirty(self):
+        return bool(self._changes)
+
+    # Read the deliveries that were in flight when the server stopped (called once at startup).
+    # They keep their retry times: clients reconnecting after the restart get them with their
+    # 'sync', so sending them again right away as well would deliver them twice.
+    def load(self):
+        try:
+            entries = self.storage.load()
+        except OSError as e:
+            logger.warning("Could not read %s: %s", self.storage.journal_file, e)
+            return
+        needs_full_save = False
+        with self._lock:
+            for entry in sorted(entries, key=lambda e: e.get('queued_ms', 0)):
+                if 'id' not in entry:
+                    # Saved by a version that rewrote the whole file and didn't key the entries
+                    entry['id'] = entry['reminder']['delivery_id']
+                    entry['queued_ms'] = entry['first_sent_ms'] or entry['reminder']['due_utc_ms']
+                    needs_full_save = True
+                self._index(entry)
+            if needs_full_save:
+                self.storage.save(list(self._entries.values()))
+        logger.info("Loaded %s unacknowledged reminder deliveries.", len(entries))
+
+    # The reminders of all deliveries in flight
+    def reminders(self):
+        with self._lock:
+            return [entry['reminder'] for entry in self._entries.values()]
+
+    # Append the changes since the last save to the journal
+    def save(self):
+        with self._lock:
+            if not self._changes:
+                return
+            changes = [('add', entry) if entry is not None else ('delete', delivery_id)
+                       for delivery_id, entry in self._changes.items()]
+            try:
+                self.storage.write(changes, lambda: list(self._entries.values()))
+                self._changes = {}
+            except OSError as e:
+                logger.exception("Error saving %s: %s", self.storage.journal_file, e)
+
+    # Fold the journal into DELIVERY_QUEUE_FILE once it has grown large (run by the retry task)
+    def compact(self):
+        with self._lock:
+            if not self.storage.needs_compaction():
+                return
+            try:
+                self.storage.compact(lambda: list(self._entries.values()))
+                self._changes = {} # Part of the snapshot
+            except OSError as e:
+                logger.exception("Error compacting %s: %s", self.storage.journal_file, e)
+
+    def close(self):
+        self.save()
+        self.storage.close()
+
+    # Add an entry to the indexes (caller holds the lock)
+    def _index(self, entry):
+        delivery_id = entry['id']
+        self._entries[delivery_id] = entry
+        self._by_channel.setdefault(reminder_channel(entry['reminder']), {})[delivery_id] = entry
+        if entry['first_sent_ms'] is None:
+            self._waiting.add(delivery_id)
+        heapq.heappush(self._retry_heap, (entry['next_retry_ms'], delivery_id))
+
+    # Record a change to an entry and reschedule its retry (caller holds the lock)
+    def _update(self, entry):
+        delivery_id = entry['id']
+        self._changes[delivery_id] = entry
+        if entry['first_sent_ms'] is not None:
+            self._waiting.discard(delivery_id)
+        heapq.heappush(self._retry_heap, (entry['next_retry_ms'], delivery_id))
+        if len(self._retry_heap) > 2 * len(self._entries) + 64:
+            # Too many stale retry times: rebuild the heap from the live entries
+            self._retry_heap = [(e['next_retry_ms'], i) for i, e in self._entries.items()]
+            heapq.heapify(self._retry_heap)
+
+    # Take an entry out of the queue and return it (caller holds the lock)
+    def _remove(self, delivery_id):
+        entry = self._entries.pop(delivery_id)
+        channel = reminder_channel(entry['reminder'])
+        channel_entries = self._by_channel[channel]
+        del channel_entries[delivery_id]
+        if not channel_entries:
+            del self._by_channel[channel]
+        self._waiting.discard(delivery_id)
+        self._changes[delivery_id] = None
+        return entry
+
+    # Delay before retrying a delivery sent attempts times
+    @staticmethod
+    def _backoff_ms(attempts):
+        return min(DELIVERY_RETRY_BASE_MS * 2 ** max(attempts - 1, 0), DELIVERY_RETRY_MAX_MS)
+
+    # Count an attempt for each entry whose channel has a client and return the reminders
+    # to send, plus the entries that ran out of attempts or time (caller holds the lock)
+    def _attempt(self, entries, now_ms):
+        online_channels = set(connected_channels.values())
+        send = []
+        expired = []
+        for entry in entries:
+            reminder = entry['reminder']
+            expires_ms = entry['queued_ms'] + DELIVERY_MAX_AGE_MS
+            if now_ms >= expires_ms:
+                self._remove(entry['id'])
+                expired.append(reminder)
+                continue
+            if reminder_channel(reminder) not in online_channels:
+                # Nobody to deliver to; check again later (or when a client connects)
+                entry['next_retry_ms'] = min(now_ms + DELIVERY_RETRY_MAX_MS, expires_ms)
+                self._update(entry)
+                continue
+            if entry['attempts'] >= DELIVERY_MAX_ATTEMPTS:
+                self._remove(entry['id'])
+                expired.append(reminder)
+                continue
+            entry['attempts'] += 1
+            if entry['first_sent_ms'] is None:
+                entry['first_sent_ms'] = now_ms
+            entry['next_retry_ms'] = now_ms + self._backoff_ms(entry['attempts'])
+            self._update(entry)
+            send.append(reminder)
+        self.counters['expired'] += len(expired)
+        return send, expired
+
+    # Put reminders that are about to fire in flight and save them to the journal right away:
+    # this runs before the reminder store removes them (see ReminderStore.mark_fired), so a
+    # crash in between can't lose a reminder
+    def enqueue(self, reminders, now_ms):
+        if not reminders:
+            return
+        dropped = []
+        with self._lock:
+            for reminder in reminders:
+                delivery_id = f"{reminder['id']}:{reminder['due_utc_ms']}"
+                if delivery_id in self._entries:
+                    self._remove(delivery_id)
+                else:
+                    audio_filename = uploaded_audio_filename(reminder)
+                    if audio_filename:
+                        uploaded_audio_store.acquire(audio_filename)
+                entry = {'id': delivery_id, 'reminder': dict(reminder, delivery_id=delivery_id), 'attempts': 0,
+                         'queued_ms': now_ms, 'first_sent_ms': None, 'next_retry_ms': now_ms}
+                self._index(entry)
+                self._changes[delivery_id] = entry
+            while len(self._entries) > DELIVERY_QUEUE_MAX_SIZE:
+                dropped.append(self._remove(next(iter(self._entries)))['reminder'])
+            self.counters['expired'] += len(dropped)
+            self.save()
+        if dropped:
+            self._give_up(dropped, f"more than {DELIVERY_QUEUE_MAX_SIZE} in flight")
+
+    # Send reminders put in flight by enqueue() to the clients of their channels
+    def deliver(self, reminders, now_ms):
+        with self._lock:
+            entries = []
+            for reminder in reminders:
+                entry = self._entries.get(f"{reminder['id']}:{reminder['due_utc_ms']}")
+                if entry is not None:
+                    entries.append(entry)
+            send, _ = self._attempt(entries, now_ms)
+            self.counters['delivered'] += len(send)
+        if send:
+            emit_due_reminders(send)
+        self._wakeup.set() # The retry task may have to wake up earlier
+
+    # Send the deliveries whose retry time has come. Returns the number sent.
+    def redeliver(self, now_ms):
+        with self._lock:
+            entries = {}
+            while self._retry_heap and self._retry_heap[0][0] <= now_ms:
+                next_retry_ms, delivery_id = heapq.heappop(self._retry_heap)
+                entry = self._entries.get(delivery_id)
+                if entry is not None and entry['next_retry_ms'] == next_retry_ms:
+                    entries[delivery_id] = entry
+            if not entries:
+                return 0
+            send, expired = self._attempt(entries.values(), now_ms)
+            self.counters['redelivered'] += len(send)
+        if expired:
+            self._give_up(expired, "not acknowledged in time")
+        if send:
+            logger.info("Redelivering %s unacknowledged reminders.", len(send), extra={'redelivered_count': len(send)})
+            emit_due_reminders(send)
+        return len(send)
+
+    # The pending deliveries of a channel, for a client of it that just connected. Sending
+    # them to that one client is not counted as an attempt, but restarts their retry timer,
+    # so the retry task doesn't send them again right after.
+    def pending(self, channel, now_ms):
+        with self._lock:
+            reminders = []
+            for entry in self._by_channel.get(channel, {}).values():
+                if entry['first_sent_ms'] is None:
+                    entry['first_sent_ms'] = now_ms
+                entry['next_retry_ms'] = now_ms + self._backoff_ms(entry['attempts'])
+                self._update(entry)
+                reminders.append(entry['reminder'])
+            return reminders
+
+    # Drop the audio references of deliveries that left the queue. The file itself is kept
+    # (as for a fired reminder); unlisted, unused files are removed at the next start.
+    def _release_audio(self, reminders):
+        for reminder in reminders:
+            audio_filename = uploaded_audio_filename(reminder)
+            if audio_filename:
+                uploaded_audio_store.release(audio_filename, delete_unused=False)
+
+    def _give_up(self, reminders, reason):
+        self._release_audio(reminders)
+        logger.warning("Gave up on %s reminder deliveries (%s).", len(reminders), reason,
+                       extra={'expired_count': len(reminders)})
+
+    # Acknowledge deliveries of a channel; returns the number that were still in flight
+    def ack(self, delivery_ids, channel, now_ms):
+        acked = []
+        with self._lock:
+            for delivery_id in delivery_ids:
+                entry = self._entries.get(delivery_id)
+                # Already acknowledged (e.g. by another client of the channel) or not ours
+                if entry is None or reminder_channel(entry['reminder']) != channel:
+                    continue
+                self._remove(delivery_id)
+                acked.append(entry['reminder'])
+                if entry['first_sent_ms'] is not None:
+                    self._ack_latencies.append(now_ms - entry['first_sent_ms'])
+                    DELIVERY_ACK_SECONDS.observe((now_ms - entry['first_sent_ms']) / 1000.0)
+            self.counters['acked'] += len(acked)
+        if acked:
+            self._release_audio(acked)
+            # The retry task saves the queue (acks arriving together are written once)
+            self._wakeup.set()
+        return len(acked)
+
+    # Seconds until the earliest retry, or None if nothing is in flight
+    def seconds_until_next_retry(self, now_ms):
+        with self._lock:
+            # Drop retry times of entries that were removed or rescheduled
+            while self._retry_heap:
+                next_retry_ms, delivery_id = self._retry_heap[0]
+                entry = self._entries.get(delivery_id)
+                if entry is not None and entry['next_retry_ms'] == next_retry_ms:
+                    return max(0, next_retry_ms - now_ms) / 1000.0
+                heapq.heappop(self._retry_heap)
+            return None
+
+    # Block until the next retry is due or the queue changes
+    def wait(self, timeout):
+        self._wakeup.wait(timeout)
+
+    # Queue depth, counters and ack latency percentiles (milliseconds, recent acks)
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._entries)
+            waiting = len(self._waiting)
+            latencies = sorted(self._ack_latencies)
+            counters = dict(self.counters)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            'in_flight': in_flight,
+            'waiting_for_client': waiting, # Never sent: no client of the channel was connected
+            'delivered': counters.get('delivered', 0),
+            'redelivered': counters.get('redelivered', 0),
+            'acked': counters.get('acked', 0),
+            'expired': counters.get('expired', 0),
+            'ack_latency_ms': {'p50': percentile(0.5), 'p99': percentile(0.99),
+                               'max': latencies[-1] if latencies else None},
+        }
+
+
+delivery_queue = DeliveryQueue(DELIVERY_QUEUE_FILE)
+delivery_queue.load()
+atexit.register(delivery_queue.close)
+metrics_registry.gauge('alarm_delivery_in_flight', 'Delivered reminders not yet acknowledged.',
+                       func=lambda: delivery_queue.stats()['in_flight'])
+metrics_registry.counter('alarm_delivery_events_total', 'Reminder deliveries by outcome.', ('outcome',),
+                         func=lambda: {(outcome,): count for outcome, count in delivery_queue.counters.items()})
+
+
+# --- Audio Library ---
+# In-memory index of the files in an audio folder. The folder is scanned once at startup
+# and the index is then updated by the upload/delete routes, so GET /audio_files no longer
+# lists and stats the whole folder on every call. Files added or removed outside the app
+# are picked up by a rescan when the folder's mtime changes (checked at most every
+# AUDIO_RESCAN_INTERVAL_MS). Duration (needs the optional mutagen package) and SHA-256
+# are computed the first time a file's details are requested and then cached.
+
+# Return the SHA-256 hex digest of a file, read in chunks
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Return an audio file's duration in seconds, or None if unknown (or mutagen isn't installed)
+def audio_duration(path):
+    if mutagen is None:
+        return None
+    try:
+        audio = mutagen.File(path)
+    except Exception as e:
+        logger.debug("Could not read audio metadata of %s: %s", path, e)
+        return None
+    if audio is None or audio.info is None:
+        return None
+    return round(audio.info.length, 3)
+
+
+class AudioLibrary:
+    def __init__(self, folder, rescan_interval_ms=0):
+        self.folder = folder
+        self.rescan_interval = rescan_interval_ms / 1000.0
+        self.version = 0 # Incremented on every change
+        # Random per-process token, so versions from before a restart are never mistaken for current ones
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._entries = {} # filename -> {'size', 'mtime_ns'} plus cached 'sha256' and 'duration'
+        self.hidden = set() # Filenames in the folder that are left out of the index
+        self._names = [] # Filenames, kept sorted (pagination order)
+        self._folder_mtime_ns = None
+        self._next_check = 0.0
+        self._lock = threading.RLock()
+
+    def _remember_folder_mtime(self):
+        # Our own uploads/deletes change the folder mtime too; record it so they don't trigger a rescan.
+        # (An outside change landing at the same moment is then only seen on the next one.)
+        try:
+            self._folder_mtime_ns = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            pass
+
+    # (Re)build the index from the folder, keeping cached metadata of unchanged files
+    def scan(self):
+        entries = {}
+        try:
+            folder_mtime_ns = os.stat(self.folder).st_mtime_ns
+            with os.scandir(self.folder) as it:
+                for dir_entry in it:
+                    # Dotfiles are bookkeeping (in-progress uploads, the unlisted file list)
+                    if dir_entry.is_file() and not dir_entry.name.startswith('.') and dir_entry.name not in self.hidden:
+                        st = dir_entry.stat()
+                        entries[dir_entry.name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        except OSError as e:
+            logger.exception("Error listing files in %s: %s", self.folder, e)
+            return
+        with self._lock:
+            for name, entry in entries.items():
+                old = self._entries.get(name)
+                if old and old['size'] == entry['size'] and old['mtime_ns'] == entry['mtime_ns']:
+                    entries[name] = old
+            self._entries = entries
+            self._names = sorted(entries)
+            self._folder_mtime_ns = folder_mtime_ns
+            self.version += 1
+        logger.info("Indexed %s audio files in %s.", len(entries), self.folder)
+
+    # Rescan if the folder changed on disk since the last scan (rate limited)
+    def refresh(self):
+        if self.rescan_interval <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.rescan_interval
+        try:
+            folder_mtime_ns = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return
+        if folder_mtime_ns != self._folder_mtime_ns:
+            logger.info("Audio folder %s changed on disk, rescanning.", self.folder)
+            self.scan()
+
+    # Add (or update) a file just written to the folder
+    def add(self, name):
+        try:
+            st = os.stat(os.path.join(self.folder, name))
+        except OSError as e:
+            logger.warning("Could not index audio file %s: %s", name, e)
+            return
+        with self._lock:
+            if name not in self._entries:
+                bisect.insort(self._names, name)
+            self._entries[name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+            self.version += 1
+            self._remember_folder_mtime()
+
+    # Drop a file just deleted from the folder
+    def remove(self, name):
+        with self._lock:
+            if self._entries.pop(name, None) is None:
+                return
+            i = bisect.bisect_left(self._names, name)
+            if i < len(self._names) and self._names[i] == name:
+                del self._names[i]
+            self.version += 1
+            self._remember_folder_mtime()
+
+    # Return (filenames, next_name) in name order, starting after the given name
+    # next_name is the last returned name if there are more files, else None
+    def list(self, after=None, limit=None):
+        with self._lock:
+            start = bisect.bisect_right(self._names, after) if after is not None else 0
+            end = len(self._names) if limit is None else min(start + limit, len(self._names))
+            names = self._names[start:end]
+            next_name = names[-1] if names and end < len(self._names) else None
+            return names, next_name
+
+    # Return the metadata of a file, computing and caching hash and duration on first use
+    def describe(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            return None
+        info = {'name': name, 'size': entry['size'], 'mtime': entry['mtime_ns'] // 1000000}
+        if 'sha256' not in entry:
+            path = os.path.join(self.folder, name)
+            try:
+                sha256 = file_sha256(path)
+            except OSError as e:
+                logger.warning("Could not hash audio file %s: %s", path, e)
+                return dict(info, duration=None, sha256=None)
+            entry['duration'] = audio_duration(path)
+            entry['sha256'] = sha256
+        return dict(info, duration=entry['duration'], sha256=entry['sha256'])
+
+
+default_audio_library = AudioLibrary(DEFAULT_AUDIO_FOLDER, AUDIO_RESCAN_INTERVAL_MS)
+uploaded_audio_library = AudioLibrary(UPLOAD_FOLDER, AUDIO_RESCAN_INTERVAL_MS)
+default_audio_library.scan()
+uploaded_audio_library.scan()
+
+
+# --- Uploaded Audio Store ---
+# Uploads are streamed to disk in chunks (no in-memory or /tmp copy) into UPLOAD_SPOOL_FOLDER,
+# hashed on the way and capped at MAX_UPLOAD_BYTES. The stored name is content-addressed,
+# '<first 32 hex chars of the SHA-256>_<original name>', so uploading the same file again
+# returns the existing copy instead of storing another one.
+# Files are reference counted by the reminders using them:
+#   - deleting a reminder drops its reference and deletes the file once no reminder uses it
+#     (as before, when a reminder's uploaded audio was deleted together with it)
+#   - deleting a file from the library only removes it from the list while reminders still
+#     use it ("unlisted"); it is deleted together with the last of them
+#   - a fired reminder's reference passes to its delivery, which drops it once acknowledged
+#     or given up (see DeliveryQueue) but never deletes the file right away, since clients
+#     fetch it to play the alarm; unlisted, unused files are removed at the next start
+# The references only cover the reminders of DATA_FILE, so .unlisted.json also records the data
+# file the folder belongs to. A server started with another data file on the same folder (a
+# benchmark or a second instance) doesn't delete any uploaded file, it only hides them.
+UNLISTED_AUDIO_FILE = os.path.join(UPLOAD_FOLDER, '.unlisted.json')
+CONTENT_ADDRESSED_NAME_PATTERN = re.compile(r'^([0-9a-f]{32})_')
+
+
+# Writable file in the spool folder that hashes what is written to it and enforces the size cap.
+# werkzeug writes each uploaded file part into one of these while parsing the request body.
+class UploadSpoolFile:
+    def __init__(self, folder, max_bytes):
+        fd, self.path = tempfile.mkstemp(prefix='.upload-', suffix='.part', dir=folder)
+        self._file = os.fdopen(fd, 'w+b')
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"File too large (max {self.max_bytes} bytes)")
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name) # read, seek, close, ... of the underlying file
+
+    # Close and delete the spool file unless it was moved into place
+    def discard(self):
+        self._file.close()
+        if not self.committed:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = UploadSpoolFile(UPLOAD_SPOOL_FOLDER, MAX_UPLOAD_BYTES)
+        if not hasattr(self, 'upload_spools'):
+            self.upload_spools = []
+        self.upload_spools.append(spool)
+        return spool
+
+
+app.request_class = UploadRequest
+
+
+# Remove spool files of uploads that failed or were deduplicated
+@app.teardown_request
+def discard_upload_spools(exc=None):
+    for spool in getattr(request, 'upload_spools', ()):
+        spool.discard()
+
+
+class UploadedAudioStore:
+    def __init__(self, library):
+        self.library = library
+        self._refs = collections.Counter() # filename -> number of reminders using it
+        self._unlisted = library.hidden # Deleted from the library but still used by reminders
+        self._by_digest = {} # hash prefix -> content-addressed filename
+        self.owned = True # Whether the folder belongs to the reminders of DATA_FILE
+        self._lock = threading.RLock()
+
+    # Count references of the loaded reminders and remove leftovers (called once at startup)
+    def load(self, reminders):
+        for reminder in reminders:
+            filename = uploaded_audio_filename(reminder)
+            if filename:
+                self._refs[filename] += 1
+        state = {}
+        try:
+            with open(UNLISTED_AUDIO_FILE, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read %s: %s", UNLISTED_AUDIO_FILE, e)
+        if isinstance(state, list):
+            state = {'files': state} # Written before the data file was recorded
+        owner = state.get('data_file')
+        if owner and os.path.abspath(owner) != os.path.abspath(DATA_FILE):
+            logger.warning("%s belongs to the reminders in %s, not %s: uploaded audio files will not be deleted.",
+                           UPLOAD_FOLDER, owner, DATA_FILE)
+            self.owned = False
+        self._unlisted.update(state.get('files', []))
+        for filename in sorted(self._unlisted):
+            if not self._refs[filename]:
+                self._delete_file(filename)
+            else:
+                self.library.remove(filename)
+        self._save_unlisted()
+        # Temporary files of the owning server may belong to uploads still in progress
+        if self.owned:
+            try:
+                for name in os.listdir(UPLOAD_FOLDER):
+                    if name.startswith('.') and name.endswith('.fast.m4a'):
+                        # Variant stored next to its upload by an older version
+                        os.replace(os.path.join(UPLOAD_FOLDER, name), audio_variant_path(name[1:-len('.fast.m4a')]))
+                    elif name.startswith('.') and name.endswith('.part'):
+                        os.remove(os.path.join(UPLOAD_FOLDER, name)) # Interrupted transcode of an older version
+                for name in os.listdir(UPLOAD_VARIANTS_FOLDER):
+                    if name.endswith('.part'):
+                        os.remove(os.path.join(UPLOAD_VARIANTS_FOLDER, name)) # Interrupted transcode
+                for name in os.listdir(UPLOAD_SPOOL_FOLDER):
+                    os.remove(os.path.join(UPLOAD_SPOOL_FOLDER, name)) # Interrupted upload
+            except OSError as e:
+                logger.warning("Could not clean up interrupted uploads in %s: %s", UPLOAD_FOLDER, e)
+        names, _ = self.library.list()
+        for filename in list(names) + list(self._unlisted):
+            match = CONTENT_ADDRESSED_NAME_PATTERN.match(filename)
+            if match:
+                self._by_digest[match.group(1)] = filename
+
+    def _save_unlisted(self):
+        if not self.owned:
+            return
+        try:
+            write_json_atomic(UNLISTED_AUDIO_FILE, {'data_file': os.path.abspath(DATA_FILE),
+                                                    'files': sorted(self._unlisted)})
+        except OSError as e:
+            logger.exception("Error saving %s: %s", UNLISTED_AUDIO_FILE, e)
+
+    def _delete_file(self, filename):
+        file_path = os.path.join(UPLOAD_FOLDER, filename)
+        if not self.owned:
+            # Reminders of the owning data file may still use it: only hide it in this run
+            logger.info("Not deleting uploaded audio file %s of another data file.", filename)
+            self.library.remove(filename)
+            self._unlisted.add(filename)
+            return True
+        try:
+            os.remove(file_path)
+            logger.info("Deleted uploaded audio file: %s", filename)
+        except FileNotFoundError:
+            logger.warning("Uploaded audio file not found in %s for deletion: %s", UPLOAD_FOLDER, filename)
+        except OSError as e:
+            logger.exception("Error deleting uploaded audio file %s: %s", file_path, e)
+            return False
+        try:
+            os.remove(audio_variant_path(filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not delete transcoded variant of %s: %s", filename, e)
+        self.library.remove(filename)
+        self._unlisted.discard(filename)
+        match = CONTENT_ADDRESSED_NAME_PATTERN.match(filename)
+        if match and self._by_digest.get(match.group(1)) == filename:
+            del self._by_digest[match.group(1)]
+        return True
+
+    # Store a fully received upload and return its filename (an existing copy if the content is known)
+    def commit(self, spool, filename):
+        digest = spool.sha256.hexdigest()[:32]
+        with self._lock:
+            existing = self._by_digest.get(digest)
+            if existing and os.path.exists(os.path.join(UPLOAD_FOLDER, existing)):
+                logger.info("Upload of %s matches stored audio file %s.", filename, existing)
+                if existing in self._unlisted:
+                    # Uploaded again after being deleted from the library: list it again
+                    self._unlisted.discard(existing)
+                    self._save_unlisted()
+                    self.library.add(existing)
+                return existing # The spool file is discarded at the end of the request
+            stored_name = f"{digest}_{filename}"
+            spool.flush()
+            spool.close()
+            os.replace(spool.path, os.path.join(UPLOAD_FOLDER, stored_name))
+            spool.committed = True
+            self._by_digest[digest] = stored_name
+            self.library.add(stored_name)
+        request_audio_variant(stored_name)
+        return stored_name
+
+    def acquire(self, filename):
+        with self._lock:
+            self._refs[filename] += 1
+
+    # Drop a reminder's reference. With delete_unused, the file is deleted once unused.
+    def release(self, filename, delete_unused=True):
+        with self._lock:
+            if self._refs[filename] > 0:
+                self._refs[filename] -= 1
+            if self._refs[filename]:
+                return
+            del self._refs[filename]
+            if delete_unused:
+                if self._delete_file(filename):
+                    self._save_unlisted()
+
+    # Delete a file from the library. Returns the number of reminders still using it
+    # (the file is then kept until they are deleted), or None if the file doesn't exist.
+    def unlist(self, filename):
+        with self._lock:
+            if not os.path.isfile(os.path.join(UPLOAD_FOLDER, filename)) or filename in self._unlisted:
+                return None
+            refs = self._refs[filename]
+            if not refs:
+                del self._refs[filename]
+                if not self._delete_file(filename):
+                    raise OSError(f"Could not delete {filename}")
+                return 0
+            self._unlisted.add(filename)
+            self._save_unlisted()
+            self.library.remove(filename)
+            return refs
+
+
+# Return the uploaded audio filename a reminder plays, or None
+def uploaded_audio_filename(reminder):
+    if reminder.get('audio_type') == 'uploaded_audio' and reminder.get('audio_filename'):
+        return secure_filename(reminder['audio_filename'])
+    return None
+
+
+# --- Transcoded Variants ---
+# With AUDIO_TRANSCODE, every upload gets a mono 64 kbit/s AAC copy in an MP4 container with
+# the index at the front ("fast start"), stored as '.variants/<filename>.fast.m4a'. Clients
+# request it with ?variant=fast; it is usually much smaller than a WAV/MP3 upload and starts
+# playing after the first few KB. Files uploaded before the option was turned on are
+# transcoded the first time their variant is requested.
+_transcodes_attempted = set() # Filenames transcoded (or tried) in this run
+_transcodes_running = set()
+_transcodes_lock = threading.Lock()
+
+
+def audio_variant_path(filename):
+    return os.path.join(UPLOAD_VARIANTS_FOLDER, filename + '.fast.m4a')
+
+
+# True while a variant may still appear for the file (so the original must not be cached as final)
+def audio_variant_pending(filename):
+    return AUDIO_TRANSCODE and (filename not in _transcodes_attempted or filename in _transcodes_running)
+
+
+# Start transcoding a file in the background, once per file and run
+def request_audio_variant(filename):
+    if not AUDIO_TRANSCODE:
+        return
+    with _transcodes_lock:
+        if filename in _transcodes_attempted:
+            return
+        _transcodes_attempted.add(filename)
+        _transcodes_running.add(filename)
+    socketio.start_background_task(target=transcode_audio, filename=filename)
+
+
+def transcode_audio(filename):
+    source = os.path.join(UPLOAD_FOLDER, filename)
+    target = audio_variant_path(filename)
+    if os.path.exists(target):
+        _transcodes_running.discard(filename)
+        return
+    temp_file = target + '.part'
+    command = [FFMPEG_PATH, '-nostdin', '-loglevel', 'error', '-y', '-i', source, '-vn',
+               '-ac', '1', '-c:a', 'aac', '-b:a', '64k', '-movflags', '+faststart', '-f', 'mp4', temp_file]
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=300)
+        if result.returncode != 0:
+            logger.warning("Could not transcode %s: %s", filename, result.stderr.decode('utf-8', 'replace').strip())
+        elif os.path.getsize(temp_file) >= os.path.getsize(source):
+            logger.info("Transcoded variant of %s is not smaller than the original, not keeping it.", filename)
+        else:
+            os.replace(temp_file, target)
+            logger.info("Transcoded %s to a fast-start variant (%s bytes).", filename, os.path.getsize(target))
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning("Could not transcode %s: %s", filename, e)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        _transcodes_running.discard(filename)
+
+
+uploaded_audio_store = UploadedAudioStore(uploaded_audio_library)
+# Deliveries still in flight keep their audio too: clients fetch it when the reminder is redelivered
+uploaded_audio_store.load(reminder_store.list() + delivery_queue.reminders())
 
 
 # --- Background Task ---
-# Background task to check for due reminders using SocketIO's background tasks
+# Background task to fire due reminders using SocketIO's background tasks
 # Using SocketIO's start_background_task is preferred with async modes
+# It is started together with the server (see start_reminder_checker), so reminders fire
+# on time even while no client is connected.
 def reminder_checker_task():
-    print("SocketIO background reminder checker task started.")
+    logger.info("SocketIO background reminder checker task started.")
     # Ensure this task runs within the Flask application context
     with app.app_context():
+        # Build the in-memory schedule once; afterwards the routes keep it up to date
+        reminder_scheduler.rebuild(reminder_store.list())
         while True:
-            # Check for due reminders every second
-            # Use socketio.sleep or time.sleep depending on async_mode
-            if socketio.async_mode in ['gevent', 'eventlet']:
-                 socketio.sleep(1)
-            else:
-                 time.sleep(1)
+            try:
+                # Sleep until the earliest deadline, or until add/delete changes it
+                reminder_scheduler.wait(reminder_scheduler.seconds_until_next(current_time_ms()))
 
-            reminders = load_reminders()
-            current_time = datetime.now(timezone.utc)
-            due_reminders = []
-            remaining_reminders = []
+                # A backlog (e.g. after downtime) is worked off in rounds of FIRE_BATCH_SIZE
+                now_ms = current_time_ms()
+                due_ids = reminder_scheduler.pop_due(now_ms, FIRE_BATCH_SIZE)
+                if not due_ids:
+                    continue
+                round_start = time.perf_counter()
+                fire_due_reminders(due_ids, now_ms)
+                CHECKER_ROUND_SECONDS.observe(time.perf_counter() - round_start)
+                if len(due_ids) == FIRE_BATCH_SIZE:
+                    socketio.sleep(0) # Let other tasks run between rounds
+            except Exception as e:
+                # Keep the checker alive; a failure here must not stop future reminders
+                logger.exception("Unexpected error in reminder checker: %s", e)
+                socketio.sleep(1)
 
-            for reminder in reminders:
-                try:
-                    # Parse the reminder time string
-                    # Ensure time parsing is robust
-                    time_str = reminder.get('time')
-                    if not time_str:
-                         print(f"Warning: Reminder ID {reminder.get('id', 'N/A')} has no time. Skipping.", file=sys.stderr)
-                         remaining_reminders.append(reminder)
-                         continue
-
-                    # Handle potential missing timezone info gracefully
-                    if time_str.endswith('Z'):
-                        time_str = time_str.replace('Z', '+00:00')
-                    elif '+' not in time_str and '-' not in time_str[1:]: # Simple check for missing offset
-                         # Assume UTC if no timezone info provided
-                         time_str += '+00:00'
-
-
-                    reminder_time = datetime.fromisoformat(time_str)
-
-                    if reminder_time <= current_time:
-                        # If reminder time is in the past or present, it's due
-                        due_reminders.append(reminder)
-                    else:
-                        # Otherwise, it remains
-                        remaining_reminders.append(reminder)
-                except (ValueError, KeyError) as e:
-                    # Handle cases where reminder time string is invalid or keys are missing
-                    print(f"Warning: Could not process reminder data for ID {reminder.get('id', 'N/A')}. Error: {e}. Keeping reminder.", file=sys.stderr)
-                    traceback.print_exc(file=sys.stderr)
-                    remaining_reminders.append(reminder) # Keep invalid or malformed reminders
-                except Exception as e:
-                    print(f"Unexpected error processing reminder ID {reminder.get('id', 'N/A')}: {e}", file=sys.stderr)
-                    traceback.print_exc(file=sys.stderr)
-                    remaining_reminders.append(reminder)
-
-
-            # If there are due reminders, emit a SocketIO event
-            if due_reminders:
-                print(f"Due reminders found: {len(due_reminders)}. Emitting 'reminder_due' event.")
-                # Emit event to all connected clients with due reminders data
-                # We send the full reminder object, which now includes 'audio_filename' and 'audio_type'
-                socketio.emit('reminder_due', due_reminders)
-                # Save only the remaining reminders back to the file
-                save_reminders(remaining_reminders)
 
+# Deliver a round of due reminders according to MISFIRE_POLICY
+def fire_due_reminders(due_ids, now_ms):
+    # Reminders later than the grace period missed their time
+    misfire_deadline = now_ms - MISFIRE_GRACE_MS
 
-# --- SocketIO Event Handlers ---
-@socketio.on('connect')
-def handle_connect():
-    print('Client connected')
-    # Start the background task when the first client connects
-    # This ensures the checker runs only when there are connected clients
-    # Use a flag in app.config or a global variable to track if the task is started
-    if not app.config.get('reminder_checker_task_started'):
-        print("Starting SocketIO background reminder checker task.")
+    def deliverable(reminders):
+        if MISFIRE_POLICY == 'drop':
+            return [r for r in reminders if r['due_utc_ms'] >= misfire_deadline]
+        return reminders
+
+    # Remove the due reminders from the store, or move recurring ones to their next
+    # occurrence (persisted by the write-behind flusher). The ones to deliver are put in
+    # flight first, so they are in the saved delivery queue before the store drops them.
+    due_reminders, rescheduled = reminder_store.mark_fired(
+        due_ids, now_ms, skip_missed=MISFIRE_POLICY != 'fire_all',
+        before_commit=lambda fired: delivery_queue.enqueue(deliverable(fired), now_ms))
+    REMINDERS_FIRED.inc(len(due_reminders))
+    fired_ms = current_time_ms()
+    for reminder in due_reminders:
+        REMINDER_FIRE_LAG_SECONDS.observe(max(0, fired_ms - reminder['due_utc_ms']) / 1000.0)
+    for reminder in rescheduled:
+        reminder_scheduler.schedule(reminder['id'], reminder['due_utc_ms'])
+    rescheduled_ids = {r['id'] for r in rescheduled}
+    # Show the next occurrence of recurring ones right away: delivery below may take a while,
+    # and a DELETE/PUT meanwhile must not have its event overtaken by this older one. A reminder
+    # deleted or replaced since mark_fired is left to the event of that change.
+    for reminder in rescheduled:
+        if reminder_store.get(reminder['id']) is reminder:
+            change_feed.publish(reminder_channel(reminder), 'reminder_updated', {'reminder': reminder})
+
+    deliver = deliverable(due_reminders)
+    missed_count = sum(1 for r in due_reminders if r['due_utc_ms'] < misfire_deadline)
+    if missed_count:
+        if MISFIRE_POLICY == 'drop':
+            logger.warning("Dropped %s reminders overdue by more than %s ms.", missed_count, MISFIRE_GRACE_MS,
+                           extra={'dropped_count': missed_count})
+        else:
+            logger.info("Delivering %s overdue reminders (misfire policy '%s').", missed_count, MISFIRE_POLICY,
+                        extra={'overdue_count': missed_count})
+
+    # If there are due reminders, emit a SocketIO event
+    if deliver:
+        logger.info("Firing %s due reminders.", len(deliver), extra={'due_count': len(deliver)})
+        # Emit event to the clients of each reminder's channel; the reminders stay in the
+        # delivery queue until a client acknowledges them
+        delivery_queue.deliver(deliver, now_ms)
+
+    # Drop the fired reminders' audio references, now that their deliveries hold their own
+    for reminder in due_reminders:
+        audio_filename = uploaded_audio_filename(reminder)
+        if audio_filename and reminder['id'] not in rescheduled_ids:
+            # Keep the file itself even if unused: clients may still be fetching it
+            uploaded_audio_store.release(audio_filename, delete_unused=False)
+
+    # Let the clients drop the fired (and dropped) reminders from their list
+    fired_by_channel = collections.defaultdict(list)
+    for reminder in due_reminders:
+        if reminder['id'] not in rescheduled_ids:
+            fired_by_channel[reminder_channel(reminder)].append(reminder['id'])
+    for channel, fired_ids in fired_by_channel.items():
+        change_feed.publish(channel, 'reminders_fired', {'ids': fired_ids})
+
+
+# Background task that sends unacknowledged reminders again (see DeliveryQueue)
+def delivery_retry_task():
+    logger.info("Reminder delivery retry task started.")
+    while True:
         try:
-            # Use socketio.start_background_task instead of threading.Thread
-            socketio.start_background_task(target=reminder_checker_task)
-            app.config['reminder_checker_task_started'] = True
-            print("SocketIO background reminder checker task started.")
+            delivery_queue.wait(delivery_queue.seconds_until_next_retry(current_time_ms()))
+            delivery_queue.redeliver(current_time_ms())
+            if delivery_queue.dirty:
+                # Write acks and retry counts at most once per PERSIST_INTERVAL_MS
+                socketio.sleep(PERSIST_INTERVAL_MS / 1000.0)
+                delivery_queue.save()
+                delivery_queue.compact()
         except Exception as e:
-            print(f"Error starting background task: {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
+            logger.exception("Unexpected error in delivery retry task: %s", e)
+            socketio.sleep(1)
+
+
+_reminder_checker_lock = threading.Lock()
+
+
+# Start the checker once per process
+def start_reminder_checker():
+    with _reminder_checker_lock:
+        if app.config.get('reminder_checker_task_started'):
+            return
+        app.config['reminder_checker_task_started'] = True
+    logger.info("Starting SocketIO background reminder checker task.")
+    try:
+        # Use socketio.start_background_task instead of threading.Thread
+        socketio.start_background_task(target=reminder_checker_task)
+        socketio.start_background_task(target=delivery_retry_task)
+    except Exception as e:
+        app.config['reminder_checker_task_started'] = False
+        logger.exception("Error starting background task: %s", e)
+
+
+# --- SocketIO Event Handlers ---
+@socketio.on('connect')
+def handle_connect(auth=None):
+    # Join the room of the channel the client asked for (sent as the Socket.IO 'auth' payload)
+    channel = normalize_channel(auth.get('channel') if isinstance(auth, dict) else None)
+    connected_channels[request.sid] = channel
+    join_room(channel_room(channel))
+    logger.debug("Client connected to channel %s", channel)
+    # The checker normally starts with the server; this covers servers that import the app
+    # instead of running this file (e.g. gunicorn)
+    start_reminder_checker()
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    connected_channels.pop(request.sid, None)
+    logger.debug("Client disconnected")
+
+
+# Clock synchronization: clients send their local time and receive the server time
+# (epoch milliseconds) as the acknowledgement. From several round trips the client
+# estimates its offset to the server clock and then ticks the clock locally,
+# instead of polling GET /time every second.
+@socketio.on('clock_sync')
+def handle_clock_sync(data=None):
+    client_time = data.get('client_time') if isinstance(data, dict) else None
+    return {'client_time': client_time, 'server_time': current_time_ms()}
+
+
+# Clients call 'sync' right after connecting (and whenever they detect a gap in the
+# delta seq numbers). The reply is sent as the event's acknowledgement:
+#   {instance_id, seq, changes: [{event, data}, ...]}  - only the missed deltas
+#   {instance_id, seq, reset: true, reminders: [...]}  - full list (first sync, server
+#                                                        restart or log overflow)
+@socketio.on('sync')
+def handle_sync(data=None):
+    data = data or {}
+    channel = connected_channels.get(request.sid, DEFAULT_CHANNEL)
+    # Hand this client the reminders its channel has not acknowledged yet (sent from here
+    # rather than from 'connect', where the client can't receive events yet)
+    pending = delivery_queue.pending(channel, current_time_ms())
+    if pending:
+        emit_due_reminders(pending, to=request.sid)
+    since_seq = data.get('since_seq')
+    if since_seq is not None and data.get('instance_id') == reminder_store.instance_id:
+        try:
+            result = change_feed.changes_since(channel, int(since_seq))
+        except (ValueError, TypeError):
+            result = None
+        if result is not None:
+            seq, changes = result
+            logger.debug("Sync from seq %s: sending %s changes.", since_seq, len(changes))
+            return {'instance_id': reminder_store.instance_id, 'seq': seq, 'changes': changes}
+    seq, reminders = change_feed.snapshot(channel)
+    logger.debug("Full sync: sending %s reminders at seq %s.", len(reminders), seq)
+    return {'instance_id': reminder_store.instance_id, 'seq': seq, 'reset': True, 'reminders': reminders}
+
+# Clients acknowledge the 'reminder_due' reminders they received: {ids: [delivery_id, ...]}.
+# Acknowledged reminders leave the delivery queue and are not sent again.
+@socketio.on('ack_reminders')
+def handle_ack_reminders(data=None):
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list):
+        return {'acked': 0}
+    channel = connected_channels.get(request.sid, DEFAULT_CHANNEL)
+    acked = delivery_queue.ack([i for i in ids if isinstance(i, str)], channel, current_time_ms())
+    return {'acked': acked}
 
 # --- Routes ---
 # Route to serve the index.html file from the base directory
 @app.route('/')
 def serve_index():
-    print("Received request for / - Serving index.html from BASE_DIR")
+    logger.debug("Received request for / - Serving index.html from BASE_DIR")
     # Serve the index.html file from the BASE_DIR
     try:
         return send_from_directory(BASE_DIR, 'index.html')
     except FileNotFoundError:
-         print(f"index.html not found in base directory: {BASE_DIR}!", file=sys.stderr)
+         logger.warning("index.html not found in base directory: %s!", BASE_DIR)
          return "index.html not found", 404
     except Exception as e:
-         print(f"Error serving index.html: {e}", file=sys.stderr)
-         traceback.print_exc(file=sys.stderr)
+         logger.exception("Error serving index.html: %s", e)
          return "Error serving index.html", 500
 
 
+# Cache policy for audio files:
+#   - content-addressed ('<sha256 prefix>_name') and UUID-named uploads never change under
+#     their name, so browsers may keep them for a year without revalidating
+#   - everything else (default sounds, legacy names) is cached but revalidated with the ETag
+# Conditional requests (If-None-Match -> 304) and Range requests (-> 206, for seeking) are
+# handled by werkzeug's send_file.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+UUID_NAME_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_')
+
+
+def send_audio_file(folder, filename, immutable, etag=True, mimetype=None):
+    response = send_from_directory(folder, filename, etag=etag, mimetype=mimetype, conditional=True)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache'
+    response.headers['Accept-Ranges'] = 'bytes' # Tell media elements they can seek with Range requests
+    return response
+
+
 # Route to serve static files from default_audio folder
 @app.route('/default_audio/<filename>')
 def serve_default_audio(filename):
-    print(f"Received request for /default_audio/{filename}")
+    logger.debug("Received request for /default_audio/%s", filename)
     # Secure filename first
     filename = secure_filename(filename)
     try:
         # Ensure file is served from the intended default folder
-        print(f"Attempting to serve from: {DEFAULT_AUDIO_FOLDER}")
-        return send_from_directory(DEFAULT_AUDIO_FOLDER, filename)
-    except FileNotFoundError:
-        print(f"Default audio file not found: {filename} in {DEFAULT_AUDIO_FOLDER}", file=sys.stderr)
+        return send_audio_file(DEFAULT_AUDIO_FOLDER, filename, immutable=False)
+    except (FileNotFoundError, NotFound):
+        logger.warning("Default audio file not found: %s in %s", filename, DEFAULT_AUDIO_FOLDER)
         return jsonify({"message": "Default audio file not found"}), 404
     except Exception as e:
-        print(f"Error serving default audio file {filename}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        logger.exception("Error serving default audio file %s: %s", filename, e)
         return jsonify({"message": "Error serving file"}), 500
 
 
 # Route to serve static files from uploaded_audio folder
+# ?variant=fast serves the transcoded variant if there is one (see Transcoded Variants),
+# otherwise the original.
 @app.route('/uploaded_audio/<filename>')
 def serve_uploaded_audio(filename):
-    print(f"Received request for /uploaded_audio/{filename}")
+    logger.debug("Received request for /uploaded_audio/%s", filename)
     # Secure filename first
     filename = secure_filename(filename)
+    match = CONTENT_ADDRESSED_NAME_PATTERN.match(filename)
+    immutable = bool(match or UUID_NAME_PATTERN.match(filename))
+    # Strong ETag: the content hash when the name carries it, else werkzeug's mtime/size based one
+    etag = match.group(1) if match else True
     try:
+        if request.args.get('variant') == 'fast':
+            variant_path = audio_variant_path(filename)
+            if os.path.isfile(variant_path):
+                return send_audio_file(UPLOAD_VARIANTS_FOLDER, os.path.basename(variant_path), immutable,
+                                       etag=etag + '-fast' if match else True, mimetype='audio/mp4')
+            if audio_variant_pending(filename) and os.path.isfile(os.path.join(UPLOAD_FOLDER, filename)):
+                request_audio_variant(filename)
+                immutable = False # The variant will replace the original at this URL
         # Ensure file is served from the intended uploaded folder
-        print(f"Attempting to serve from: {UPLOAD_FOLDER}")
-        return send_from_directory(UPLOAD_FOLDER, filename)
-    except FileNotFoundError:
-        print(f"Uploaded audio file not found: {filename} in {UPLOAD_FOLDER}", file=sys.stderr)
+        return send_audio_file(UPLOAD_FOLDER, filename, immutable, etag=etag)
+    except (FileNotFoundError, NotFound):
+        logger.warning("Uploaded audio file not found: %s in %s", filename, UPLOAD_FOLDER)
         return jsonify({"message": "Uploaded audio file not found"}), 404
     except Exception as e:
-        print(f"Error serving uploaded audio file {filename}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        logger.exception("Error serving uploaded audio file %s: %s", filename, e)
         return jsonify({"message": "Error serving file"}), 500
 
 
-# New route to get lists of available and uploaded audio files
+# List endpoints (GET /audio_files, GET /reminders) share conditional requests and pagination:
+# the ETag is the version of the data the response is built from plus a hash of the query, so
+# clients re-polling an unchanged list with If-None-Match get an empty 304.
+def list_etag(version):
+    query_string = request.query_string.decode('utf-8', 'replace')
+    query_hash = hashlib.sha1(query_string.encode('utf-8')).hexdigest()[:12]
+    return f"{version}-{query_hash}"
+
+
+# A list response carrying etag (an empty 304 when body is None), which browsers may cache
+# but always revalidate with If-None-Match
+def list_response(etag, body=None):
+    response = app.response_class(status=304) if body is None else jsonify(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# Parse the limit/cursor query parameters into (limit, after), where limit is capped at
+# max_page_size and after is the decoded cursor. Either is None when not given. Raises
+# ValueError for a bad limit or cursor.
+def parse_page_args(args, max_page_size, decode_cursor):
+    limit = args.get('limit', type=int)
+    if 'limit' in args and (limit is None or limit < 1):
+        raise ValueError("limit must be a positive integer")
+    if limit is not None:
+        limit = min(limit, max_page_size)
+    cursor = args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+# Maximum page size for GET /audio_files?limit=...
+MAX_AUDIO_FILES_PAGE_SIZE = 1000
+
+
+# Encode/decode the opaque /audio_files pagination cursor (the last uploaded filename on a page)
+def encode_audio_files_cursor(name):
+    return base64.urlsafe_b64encode(name.encode('utf-8')).decode('ascii')
+
+
+def decode_audio_files_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+# Route to get lists of available and uploaded audio files, served from the audio library index
+# Without parameters the response is {"available": [...], "uploaded": [...]} of filenames as before.
+# Query parameters:
+#   limit=N    - page size for the uploaded list (max MAX_AUDIO_FILES_PAGE_SIZE); the response
+#                gains "next_cursor" (the small default list is returned in full on every page)
+#   cursor=... - next_cursor from the previous page
+#   details=1  - return {name, size, mtime, duration, sha256} objects instead of filenames
+#                (implies pagination, since hashes are computed on first request)
+# Responses carry an ETag derived from the library versions, for If-None-Match revalidation.
 @app.route('/audio_files', methods=['GET'])
 def get_audio_files():
-    print("Received GET request for /audio_files")
-    available_files = []
-    uploaded_files = []
+    logger.debug("Received GET request for /audio_files")
+    args = request.args
+    default_audio_library.refresh()
+    uploaded_audio_library.refresh()
 
-    # Get files from default_audio folder
-    try:
-        # List files in the default audio folder, filtering out directories
-        available_files = [f for f in os.listdir(DEFAULT_AUDIO_FOLDER) if os.path.isfile(os.path.join(DEFAULT_AUDIO_FOLDER, f))]
-        print(f"Found {len(available_files)} available audio files.")
-    except OSError as e:
-        print(f"Error listing files in {DEFAULT_AUDIO_FOLDER}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+    etag = list_etag(f"{default_audio_library.instance_id}-{default_audio_library.version}-"
+                     f"{uploaded_audio_library.instance_id}-{uploaded_audio_library.version}")
+    if request.if_none_match.contains(etag):
+        return list_response(etag)
 
-    # Get files from uploaded_audio folder
     try:
-        # List files in the uploaded audio folder, filtering out directories
-        uploaded_files = [f for f in os.listdir(UPLOAD_FOLDER) if os.path.isfile(os.path.join(UPLOAD_FOLDER, f))]
-        print(f"Found {len(uploaded_files)} uploaded audio files.")
-    except OSError as e:
-        print(f"Error listing files in {UPLOAD_FOLDER}: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
+        limit, after = parse_page_args(args, MAX_AUDIO_FILES_PAGE_SIZE, decode_audio_files_cursor)
+    except ValueError as e:
+        logger.warning("Invalid query for GET /audio_files: %s", e)
+        return jsonify({"message": str(e)}), 400
+    details = args.get('details') in ('1', 'true')
+    paginated = limit is not None or after is not None or details
+    if paginated and limit is None:
+        limit = MAX_AUDIO_FILES_PAGE_SIZE
+
+    available_files, _ = default_audio_library.list()
+    uploaded_files, next_name = uploaded_audio_library.list(after, limit)
+    logger.debug("Returning %s available and %s uploaded audio files.", len(available_files), len(uploaded_files))
+    if details:
+        available_files = [info for info in map(default_audio_library.describe, available_files) if info]
+        uploaded_files = [info for info in map(uploaded_audio_library.describe, uploaded_files) if info]
 
     # Return a dictionary with two lists
     audio_files_info = {"available": available_files, "uploaded": uploaded_files}
-    print(f"Returning audio files info: {audio_files_info}")
-    return jsonify(audio_files_info), 200
+    if paginated:
+        audio_files_info["next_cursor"] = encode_audio_files_cursor(next_name) if next_name else None
+    return list_response(etag, audio_files_info)
 
 
 # Route to upload an audio file to the uploaded_audio folder
 @app.route('/upload_audio', methods=['POST'])
 def upload_audio():
-    print("Received POST request for /upload_audio")
-    if 'audio_file' not in request.files:
-        print("No audio_file part in the request", file=sys.stderr)
+    logger.debug("Received POST request for /upload_audio")
+    # Refuse bodies that are declared too large up front (64 KiB allowance for the multipart framing);
+    # otherwise the cap is enforced while the file is streamed to disk
+    if MAX_UPLOAD_BYTES and request.content_length and request.content_length > MAX_UPLOAD_BYTES + 64 * 1024:
+        logger.warning("Rejected upload of %s bytes (max %s)", request.content_length, MAX_UPLOAD_BYTES)
+        return jsonify({"message": f"File too large (max {MAX_UPLOAD_BYTES} bytes)"}), 413
+    try:
+        files = request.files
+    except RequestEntityTooLarge:
+        logger.warning("Rejected upload larger than %s bytes", MAX_UPLOAD_BYTES)
+        return jsonify({"message": f"File too large (max {MAX_UPLOAD_BYTES} bytes)"}), 413
+
+    if 'audio_file' not in files:
+        logger.warning("No audio_file part in the request")
         return jsonify({"message": "No audio_file part in the request"}), 400
 
-    audio_file = request.files['audio_file']
-    print(f"Received file for upload: {audio_file.filename}")
+    audio_file = files['audio_file']
+    logger.debug("Received file for upload: %s", audio_file.filename)
 
     # If the user does not select a file, the browser submits an
     # empty file without a filename.
     if audio_file.filename == '':
-        print("No selected file for upload", file=sys.stderr)
+        logger.warning("No selected file for upload")
         return jsonify({"message": "No selected file"}), 400
 
     if audio_file:
         # Use secure_filename to prevent directory traversal attacks
-        filename = secure_filename(audio_file.filename)
-        # Create a unique filename to avoid collisions
-        unique_filename = str(uuid.uuid4()) + '_' + filename
-        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+        filename = secure_filename(audio_file.filename) or 'audio'
         try:
-            print(f"Attempting to save file to: {file_path}")
-            audio_file.save(file_path)
-            print(f"Audio file uploaded successfully: {file_path}")
-            # Return the unique filename and type to the frontend
-            return jsonify({"message": "File uploaded successfully", "filename": unique_filename, "audio_type": "uploaded_audio"}), 200 # Return type here
+            # The file is already on disk (streamed while the request was parsed), move it into place
+            stored_filename = uploaded_audio_store.commit(audio_file.stream, filename)
+            logger.info("Audio file uploaded: %s (%s bytes)", stored_filename, audio_file.stream.size)
+            # Return the stored filename and type to the frontend
+            return jsonify({"message": "File uploaded successfully", "filename": stored_filename, "audio_type": "uploaded_audio"}), 200 # Return type here
         except IOError as e:
-            print(f"Error saving file {file_path}: {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
+            logger.exception("Error saving uploaded file %s: %s", filename, e)
             return jsonify({"message": "Error saving file"}), 500
         except Exception as e:
-            print(f"Unexpected error during file upload: {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
+            logger.exception("Unexpected error during file upload: %s", e)
             return jsonify({"message": "An unexpected error occurred during upload"}), 500
 
 
 # Route to delete an audio file from the uploaded_audio folder
 @app.route('/uploaded_audio/<filename>', methods=['DELETE'])
 def delete_uploaded_audio_route(filename): # Renamed route function to avoid conflict if needed later
-    print(f"Received DELETE request for uploaded audio file: {filename}")
+    logger.debug("Received DELETE request for uploaded audio file: %s", filename)
     # Use secure_filename for safety
     filename = secure_filename(filename)
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
 
-    # Check if the file exists and is in the UPLOAD_FOLDER
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        try:
-            print(f"Attempting to delete file: {file_path}")
-            os.remove(file_path)
-            print(f"File deleted successfully: {file_path}")
-            return jsonify({"message": "File deleted successfully"}), 200
-        except OSError as e:
-            print(f"Error deleting file {file_path}: {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
-            return jsonify({"message": f"Error deleting file: {e}"}), 500
-        except Exception as e:
-            print(f"Unexpected error during file deletion: {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
-            return jsonify({"message": "An unexpected error occurred during deletion"}), 500
-    else:
-        print(f"File not found in {UPLOAD_FOLDER} for deletion: {filename}", file=sys.stderr)
+    try:
+        # Files still used by reminders are only removed from the list until the last of them is deleted
+        remaining_refs = uploaded_audio_store.unlist(filename)
+    except OSError as e:
+        logger.exception("Error deleting file %s: %s", filename, e)
+        return jsonify({"message": f"Error deleting file: {e}"}), 500
+    except Exception as e:
+        logger.exception("Unexpected error during file deletion: %s", e)
+        return jsonify({"message": "An unexpected error occurred during deletion"}), 500
+    if remaining_refs is None:
+        logger.warning("File not found in %s for deletion: %s", UPLOAD_FOLDER, filename)
         return jsonify({"message": "File not found in uploaded folder"}), 404
+    if remaining_refs:
+        logger.info("Uploaded audio file %s removed from the library, kept for %s reminders.", filename, remaining_refs)
+        return jsonify({"message": "File deleted successfully", "kept_for_reminders": remaining_refs}), 200
+    return jsonify({"message": "File deleted successfully"}), 200
+
+
+# Maximum page size for GET /reminders?limit=...
+MAX_REMINDERS_PAGE_SIZE = 1000
+
+
+# Encode/decode the opaque pagination cursor (the sort key of the last reminder on a page)
+def encode_reminders_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
 
 
-# Route to get all reminders
+def decode_reminders_cursor(cursor):
+    try:
+        is_invalid, due_utc_ms, reminder_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (bool(is_invalid), int(due_utc_ms), str(reminder_id))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+# Parse a due_before/due_after query parameter (ISO 8601 time or epoch milliseconds)
+def parse_due_filter(value):
+    if value is None:
+        return None
+    if value.isdigit():
+        return int(value)
+    return due_ms_from_time(value)
+
+
+# Route to get reminders, ordered by due time
+# Without 'limit' or 'cursor' the full (filtered) list is returned as before.
+# Query parameters:
+#   limit=N              - page size (max MAX_REMINDERS_PAGE_SIZE); the response becomes
+#                          {"reminders": [...], "next_cursor": ...}
+#   cursor=...           - next_cursor from the previous page
+#   due_after=T          - only reminders due at or after T (ISO 8601 or epoch ms)
+#   due_before=T         - only reminders due strictly before T
+#   audio_type=...       - only reminders with this audio_type
+#   channel=...          - only reminders of this channel
+#   text_prefix=...      - only reminders whose text starts with this (case-insensitive)
+#   fields=a,b           - only return these fields ('id' is always included)
+# Responses carry a strong ETag derived from the store version (see list_etag).
 @app.route('/reminders', methods=['GET'])
 def get_reminders():
-    print("Received GET request for /reminders")
-    # Load reminders from the file and return as JSON
-    reminders = load_reminders()
-    print(f"Returning {len(reminders)} reminders.")
-    return jsonify(reminders)
+    logger.debug("Received GET request for /reminders")
+    args = request.args
+
+    # The ETag is computed before any work, from the store version and the query itself
+    etag = list_etag(f"{reminder_store.instance_id}-{reminder_store.version}")
+    if request.if_none_match.contains(etag):
+        return list_response(etag)
+
+    try:
+        limit, after_key = parse_page_args(args, MAX_REMINDERS_PAGE_SIZE, decode_reminders_cursor)
+        due_after_ms = parse_due_filter(args.get('due_after'))
+        due_before_ms = parse_due_filter(args.get('due_before'))
+    except ValueError as e:
+        logger.warning("Invalid query for GET /reminders: %s", e)
+        return jsonify({"message": str(e)}), 400
+    paginated = limit is not None or after_key is not None
+    if paginated and limit is None:
+        limit = MAX_REMINDERS_PAGE_SIZE
+
+    # Combine the attribute filters into one predicate
+    audio_type = args.get('audio_type')
+    channel = args.get('channel')
+    text_prefix = args.get('text_prefix')
+    predicate = None
+    if audio_type is not None or channel is not None or text_prefix:
+        text_prefix = (text_prefix or '').casefold()
+        def predicate(reminder):
+            if audio_type is not None and reminder.get('audio_type') != audio_type:
+                return False
+            if channel is not None and reminder_channel(reminder) != channel:
+                return False
+            return str(reminder.get('text', '')).casefold().startswith(text_prefix)
+
+    reminders, next_key = reminder_store.query(after_key, due_after_ms, due_before_ms, predicate, limit)
+
+    # Field projection
+    fields = args.get('fields')
+    if fields:
+        wanted = {'id'} | {f.strip() for f in fields.split(',') if f.strip()}
+        reminders = [{k: v for k, v in r.items() if k in wanted} for r in reminders]
+
+    logger.debug("Returning %s reminders.", len(reminders))
+    if paginated:
+        body = {"reminders": reminders, "next_cursor": encode_reminders_cursor(next_key) if next_key else None}
+    else:
+        body = reminders
+    return list_response(etag, body)
+
+# Maximum number of reminders in one POST/DELETE /reminders:batch request
+MAX_BATCH_SIZE = 10000
+# Imported reminders are added to the store in batches of this size
+IMPORT_CHUNK_SIZE = 500
+# At most this many per-line errors are reported for an import (all are counted)
+MAX_IMPORT_ERRORS = 1000
+
+
+# Validate reminder data sent by a client and build the record to store.
+# keep_id keeps a client-supplied 'id' (imports of exported data), otherwise a new one is generated.
+# Raises ValueError with a message for the client if the data is invalid.
+def build_reminder(data, keep_id=False):
+    if not isinstance(data, dict) or 'text' not in data or 'time' not in data:
+        raise ValueError("Missing text or time")
+
+    # Validate and normalize the time once here, so the checker only compares integers
+    try:
+        due_utc_ms = due_ms_from_time(data['time'])
+    except ValueError as e:
+        raise ValueError(f"Invalid time: {e}")
+
+    # Validate an optional recurrence rule (see recurrence.py)
+    recurrence = None
+    if data.get('recurrence'):
+        rule = data['recurrence']
+        # Exported rules carry the first occurrence that anchors them, new ones start at 'time'
+        dtstart = rule.get('dtstart') if isinstance(rule, dict) and rule.get('dtstart') else data['time']
+        try:
+            recurrence = parse_recurrence(rule, dtstart, data.get('timezone'))
+        except ValueError as e:
+            raise ValueError(f"Invalid recurrence: {e}")
+
+    reminder_id = data.get('id') if keep_id else None
+    if reminder_id is not None and (not isinstance(reminder_id, str) or not reminder_id):
+        raise ValueError("Invalid id")
+
+    reminder = {
+        'id': reminder_id or str(uuid.uuid4()), # Generate a unique ID for a new reminder
+        'text': data['text'],
+        'time': data['time'], # time_str is already in ISO format from frontend
+        'due_utc_ms': due_utc_ms, # Canonical UTC due time in epoch milliseconds
+        'audio_filename': data.get('audio_filename', None), # Ensure audio_filename is present
+        'audio_type': data.get('audio_type', None), # Ensure audio_type is present
+        'channel': normalize_channel(data.get('channel')) # Owner channel, decides which clients are notified
+    }
+    if recurrence:
+        occurrence = data.get('occurrence', 1)
+        if not isinstance(occurrence, int) or isinstance(occurrence, bool) or occurrence < 1:
+            raise ValueError("Invalid occurrence")
+        reminder['recurrence'] = recurrence
+        reminder['occurrence'] = occurrence # Number of the occurrence 'time' refers to
+    return reminder
+
+
+# Bookkeeping for reminders just added to the store: audio references, the scheduler and
+# the change feed. Batches are announced with one 'reminders_added' event per channel.
+def announce_added_reminders(reminders, batch=False):
+    by_channel = collections.defaultdict(list)
+    for reminder in reminders:
+        audio_filename = uploaded_audio_filename(reminder)
+        if audio_filename:
+            uploaded_audio_store.acquire(audio_filename)
+        # Hand the new deadline to the scheduler (wakes the checker if it is now the earliest)
+        reminder_scheduler.schedule(reminder['id'], reminder['due_utc_ms'])
+        by_channel[reminder['channel']].append(reminder)
+    for channel, channel_reminders in by_channel.items():
+        if batch:
+            change_feed.publish(channel, 'reminders_added', {'reminders': channel_reminders})
+        else:
+            for reminder in channel_reminders:
+                change_feed.publish(channel, 'reminder_added', {'reminder': reminder})
+
+
+# Bookkeeping for reminders just deleted from the store (see announce_added_reminders)
+def announce_deleted_reminders(reminders, batch=False):
+    by_channel = collections.defaultdict(list)
+    for reminder in reminders:
+        # --- Logic: Delete associated uploaded audio file ---
+        # The file is only deleted if no other reminder uses it (uploads are deduplicated)
+        audio_filename = uploaded_audio_filename(reminder)
+        if audio_filename:
+            uploaded_audio_store.release(audio_filename)
+        # --- END Logic ---
+        reminder_scheduler.unschedule(reminder['id'])
+        by_channel[reminder_channel(reminder)].append(reminder['id'])
+    for channel, ids in by_channel.items():
+        if batch:
+            change_feed.publish(channel, 'reminders_deleted', {'ids': ids})
+        else:
+            for reminder_id in ids:
+                change_feed.publish(channel, 'reminder_deleted', {'id': reminder_id})
+
 
 # Route to add a new reminder
 @app.route('/reminders', methods=['POST'])
 def add_reminder():
-    print("Received POST request for /reminders")
+    logger.debug("Received POST request for /reminders")
     # Get the reminder data from the request body (JSON)
     # The frontend now sends audio_filename and audio_type in the JSON body
-    new_reminder_data = request.json
-    print(f"Received reminder data: {new_reminder_data}")
-    if not new_reminder_data or 'text' not in new_reminder_data or 'time' not in new_reminder_data:
-        # Return an error if the required fields are missing
-        print("Missing text or time in POST request", file=sys.stderr)
-        return jsonify({"message": "Missing text or time"}), 400
-
-    reminders = load_reminders()
-    # Generate a unique ID for the new reminder
-    new_reminder = {
-        'id': str(uuid.uuid4()),
-        'text': new_reminder_data['text'],
-        'time': new_reminder_data['time'], # time_str is already in ISO format from frontend
-        'audio_filename': new_reminder_data.get('audio_filename', None), # Ensure audio_filename is present
-        'audio_type': new_reminder_data.get('audio_type', None) # Ensure audio_type is present
-    }
-    print(f"Adding new reminder: {new_reminder}")
+    try:
+        new_reminder = build_reminder(request.get_json(silent=True))
+    except ValueError as e:
+        logger.warning("Invalid reminder in POST request: %s", e)
+        return jsonify({"message": str(e)}), 400
 
-    # Append the new reminder to the list
-    reminders.append(new_reminder)
-    # Save the updated list back to the file
-    save_reminders(reminders)
-    print(f"Added new reminder: {new_reminder['id']}")
+    # Add the new reminder to the store (persisted according to PERSIST_MODE)
+    reminder_store.add(new_reminder)
+    announce_added_reminders([new_reminder])
+    logger.debug("Added new reminder %s", new_reminder['id'], extra={'reminder_id': new_reminder['id'], 'due_utc_ms': new_reminder['due_utc_ms']})
     # Return the newly added reminder with a 201 status code
     return jsonify(new_reminder), 201
 
+# Route to add many reminders at once
+# Body: a JSON list of reminders (as for POST /reminders) or {"reminders": [...]}.
+# All of them are validated first; if any is invalid nothing is added and the response
+# lists the errors as [{index, message}]. Otherwise they are added with one persistence
+# flush and one change event per channel.
+@app.route('/reminders:batch', methods=['POST'])
+def add_reminders_batch():
+    logger.debug("Received POST request for /reminders:batch")
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('reminders')
+    if not isinstance(data, list):
+        return jsonify({"message": "Expected a list of reminders"}), 400
+    if len(data) > MAX_BATCH_SIZE:
+        return jsonify({"message": f"Too many reminders (max {MAX_BATCH_SIZE} per batch)"}), 400
+
+    new_reminders = []
+    errors = []
+    for index, item in enumerate(data):
+        try:
+            new_reminders.append(build_reminder(item))
+        except ValueError as e:
+            errors.append({"index": index, "message": str(e)})
+    if errors:
+        logger.warning("Rejected batch of %s reminders with %s invalid items", len(data), len(errors))
+        return jsonify({"message": "Invalid reminders, nothing was added", "errors": errors}), 400
+
+    reminder_store.add_many(new_reminders)
+    announce_added_reminders(new_reminders, batch=True)
+    logger.info("Added batch of %s reminders.", len(new_reminders), extra={'batch_size': len(new_reminders)})
+    return jsonify({"reminders": new_reminders}), 201
+
 # Route to delete a reminder by ID
 @app.route('/reminders/<reminder_id>', methods=['DELETE'])
 def delete_reminder(reminder_id):
-    print(f"Received DELETE request for /reminders/{reminder_id}")
-    reminders = load_reminders()
-    # Find the reminder to get its audio filename and type before deleting
-    reminder_to_delete = next((r for r in reminders if r.get('id') == reminder_id), None)
-    print(f"Reminder to delete found: {reminder_to_delete}")
+    logger.debug("Received DELETE request for /reminders/%s", reminder_id)
+    # Remove the reminder from the store by ID, keeping it to get its audio filename and type
+    reminder_to_delete = reminder_store.delete(reminder_id)
 
-    # Filter out the reminder with the matching ID
-    initial_count = len(reminders)
-    reminders = [r for r in reminders if r.get('id') != reminder_id]
-
-    if len(reminders) == initial_count:
+    if reminder_to_delete is None:
         # Return an error if no reminder was found with the given ID
-        print(f"Reminder with ID {reminder_id} not found for deletion.", file=sys.stderr)
+        logger.warning("Reminder with ID %s not found for deletion.", reminder_id)
         return jsonify({"message": "Reminder not found"}), 404
 
-    # --- Logic: Delete associated uploaded audio file ---
-    # Check if the deleted reminder had an associated audio file and if it was uploaded
-    if reminder_to_delete and reminder_to_delete.get('audio_filename') and reminder_to_delete.get('audio_type') == 'uploaded_audio':
-        filename = secure_filename(reminder_to_delete['audio_filename'])
-        file_path_uploaded = os.path.join(UPLOAD_FOLDER, filename) # Use UPLOAD_FOLDER constant
+    announce_deleted_reminders([reminder_to_delete])
+    logger.debug("Deleted reminder %s", reminder_id, extra={'reminder_id': reminder_id})
+    # Return a success message
+    return jsonify({"message": "Reminder deleted"}), 200
+
+# Route to delete many reminders at once
+# Body: {"ids": [...]}. If any id does not exist nothing is deleted and the response lists
+# the missing ones as [{index, id, message}]; otherwise all are deleted with one flush.
+@app.route('/reminders:batch', methods=['DELETE'])
+def delete_reminders_batch():
+    logger.debug("Received DELETE request for /reminders:batch")
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(reminder_id, str) for reminder_id in ids):
+        return jsonify({"message": "Expected {\"ids\": [...]}"}), 400
+    if len(ids) > MAX_BATCH_SIZE:
+        return jsonify({"message": f"Too many ids (max {MAX_BATCH_SIZE} per batch)"}), 400
+
+    removed, missing_ids = reminder_store.delete_many(ids, require_all=True)
+    if missing_ids:
+        missing = set(missing_ids)
+        errors = [{"index": index, "id": reminder_id, "message": "Reminder not found"}
+                  for index, reminder_id in enumerate(ids) if reminder_id in missing]
+        logger.warning("Rejected batch delete of %s reminders: %s not found", len(ids), len(missing))
+        return jsonify({"message": "Reminders not found, nothing was deleted", "errors": errors}), 404
+
+    announce_deleted_reminders(removed, batch=True)
+    logger.info("Deleted batch of %s reminders.", len(removed), extra={'batch_size': len(removed)})
+    return jsonify({"message": "Reminders deleted", "deleted": len(removed)}), 200
+
+# Route to import reminders from NDJSON (one reminder object per line, as produced by
+# GET /reminders:export). The body is read line by line and added in batches of
+# IMPORT_CHUNK_SIZE, so large imports are never held in memory as a whole. Invalid lines
+# are skipped and reported as [{line, message}]; the others are imported.
+# Ids are kept, so an export can be restored; lines whose id already exists are rejected.
+@app.route('/reminders:import', methods=['POST'])
+def import_reminders():
+    logger.debug("Received POST request for /reminders:import")
+    imported = 0
+    failed = 0
+    errors = []
+    chunk = []
+    chunk_ids = set()
+
+    def add_chunk():
+        reminder_store.add_many(chunk)
+        announce_added_reminders(chunk, batch=True)
 
-        # Check if the file exists in the UPLOAD_FOLDER before attempting deletion
-        if os.path.exists(file_path_uploaded) and os.path.isfile(file_path_uploaded):
+    for line_number, line in enumerate(request.stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
             try:
-                print(f"Attempting to delete associated uploaded audio file: {file_path_uploaded}")
-                os.remove(file_path_uploaded)
-                print(f"Deleted associated uploaded audio file: {file_path_uploaded}")
-            except OSError as e:
-                print(f"Error deleting associated uploaded audio file {file_path_uploaded}: {e}", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
-            except Exception as e:
-                print(f"Unexpected error deleting associated uploaded audio file {file_path_uploaded}: {e}", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
-        else:
-             print(f"Associated uploaded audio file not found in {UPLOAD_FOLDER} for deletion: {file_path_uploaded}", file=sys.stderr)
-    # --- END Logic ---
+                data = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON: {e}")
+            reminder = build_reminder(data, keep_id=True)
+            if reminder['id'] in chunk_ids or reminder_store.get(reminder['id']) is not None:
+                raise ValueError(f"Reminder {reminder['id']} already exists")
+        except ValueError as e:
+            failed += 1
+            if len(errors) < MAX_IMPORT_ERRORS:
+                errors.append({"line": line_number, "message": str(e)})
+            continue
+        chunk.append(reminder)
+        chunk_ids.add(reminder['id'])
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            add_chunk()
+            imported += len(chunk)
+            chunk = []
+            chunk_ids = set()
+    if chunk:
+        add_chunk()
+        imported += len(chunk)
 
+    logger.info("Imported %s reminders (%s invalid lines).", imported, failed, extra={'imported': imported, 'failed': failed})
+    return jsonify({"imported": imported, "failed": failed, "errors": errors,
+                    "errors_truncated": failed > len(errors)}), 200
+
+# Route to export reminders as NDJSON, in due time order
+# Streamed page by page from the store, so the response is never built in memory.
+# Optional ?channel=... exports only that channel.
+@app.route('/reminders:export', methods=['GET'])
+def export_reminders():
+    logger.debug("Received GET request for /reminders:export")
+    channel = request.args.get('channel')
+    predicate = None
+    if channel is not None:
+        def predicate(reminder):
+            return reminder_channel(reminder) == channel
+
+    def generate():
+        after_key = None
+        while True:
+            reminders, after_key = reminder_store.query(after_key, predicate=predicate, limit=IMPORT_CHUNK_SIZE)
+            if reminders:
+                yield ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in reminders)
+            if after_key is None:
+                break
+
+    response = app.response_class(generate(), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename=reminders.ndjson'
+    return response
+
+# Route to get the state of the delivery queue: depth, counters and ack latency
+@app.route('/deliveries', methods=['GET'])
+def get_delivery_stats():
+    return jsonify(delivery_queue.stats()), 200
+
+
+# Route to get the metrics in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+MAX_PROFILE_SECONDS = 300
+stack_sampler = StackSampler()
+
+
+def profiling_enabled():
+    return PROFILING_ENABLED or os.path.exists(PROFILING_FLAG_FILE)
+
+
+# Route to profile the running server (only with ALARM_PROFILING=1 or PROFILING_FLAG_FILE):
+# samples the stacks of all threads for ?seconds= (default 10) every ?interval_ms= (default 5)
+# and returns them as collapsed stacks ("frame;frame;frame count" lines, for flamegraph.pl or
+# speedscope). Under gevent all greenlets share one thread, so each sample only shows the
+# greenlet that happens to be running (often the hub, when the server is idle).
+@app.route('/debug/profile', methods=['POST'])
+def profile_server():
+    if not profiling_enabled():
+        return jsonify({"error": f"Profiling is disabled (set ALARM_PROFILING=1 or create {os.path.basename(PROFILING_FLAG_FILE)})"}), 404
+    try:
+        seconds = float(request.args.get('seconds', '10'))
+        interval_ms = float(request.args.get('interval_ms', '5'))
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+    if not 0 < seconds <= MAX_PROFILE_SECONDS or not 1 <= interval_ms <= 1000:
+        return jsonify({"error": f"seconds must be in (0, {MAX_PROFILE_SECONDS}] and interval_ms in [1, 1000]"}), 400
+    if stack_sampler.running:
+        return jsonify({"error": "A profile is already running"}), 409
+    logger.info("Profiling for %s s.", seconds)
+    # The sampler runs in its own thread; wait cooperatively so the server keeps running
+    thread, result = stack_sampler.start(seconds, interval_ms / 1000.0)
+    while thread.is_alive():
+        socketio.sleep(0.1)
+    if 'error' in result:
+        return jsonify({"error": str(result['error'])}), 409
+    return Response(result['stacks'], mimetype='text/plain')
 
-    # Save the updated list back to the file
-    save_reminders(reminders)
-    print(f"Deleted reminder with ID: {reminder_id}")
-    # Return a success message
-    return jsonify({"message": "Reminder deleted"}), 200
 
 # Route to get the current server time
 @app.route('/time', methods=['GET'])
 def get_server_time():
-    print("Received GET request for /time")
+    # No logging here: this route may be hit often (the web client uses the 'clock_sync' Socket.IO event instead)
     # Get the current time on the server in UTC
     now = datetime.now(timezone.utc)
     # Format the time as an ISO 8601 string
     server_time_str = now.isoformat()
-    print(f"Returning server time: {server_time_str}")
     # Return the time as JSON
     return jsonify({"server_time": server_time_str}), 200
 
 
 # Run the Flask application with SocketIO
 if __name__ == '__main__':
-    print("Starting Flask app with SocketIO...")
+    logger.info("Starting Flask app with SocketIO...")
     try:
+        debug = DEBUG
         # Start the background reminder checker task using SocketIO's method
         # This is better integrated with the async mode (gevent or threading)
-        # The task will be started on the first client connection in handle_connect
-        print("Reminder checker task will be started on first client connection.")
+        # With the debug reloader this process only watches files and restarts the real server
+        # process (WERKZEUG_RUN_MAIN is set there); firing reminders here would fire them twice
+        if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_reminder_checker()
+
+        # Turn SIGINT (sent by main.js when Electron quits) and SIGTERM into a normal exit,
+        # so the atexit handlers flush pending reminder changes and the delivery queue to disk
+        signal.signal(signal.SIGINT, lambda signum, frame: sys.exit(0))
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
         # Run the app using socketio.run instead of app.run
         # host='0.0.0.0' makes the server publicly accessible (useful with ngrok)
         # async_mode is set in the SocketIO initialization, debug=True enables reloader and debugger
-        print(f"Running SocketIO app on http://0.0.0.0:{5000}")
-        socketio.run(app, debug=True, host='0.0.0.0', port=5000) # Explicitly set port
-        print("SocketIO app finished running.")
+        logger.info("Running SocketIO app on http://0.0.0.0:%s", 5000)
+        # log_output=False keeps the server from logging every HTTP request (set ALARM_ACCESS_LOG=1 to enable)
+        # allow_unsafe_werkzeug: in threading mode the werkzeug server also serves the desktop app outside debug mode
+        socketio.run(app, debug=debug, host='0.0.0.0', port=5000, log_output=ACCESS_LOG,
+                     allow_unsafe_werkzeug=True) # Explicitly set port
+        logger.info("SocketIO app finished running.")
     except Exception as e:
-        print(f"Error during Flask app startup: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr) # Print traceback for startup error
+        logger.exception("Error during Flask app startup: %s", e)
         sys.exit(1) # Exit with a non-zero code to indicate failure
@@ -0,0 +1,441 @@
+# Benchmark: end-to-end load and latency of the Flask/Socket.IO backend
+#
+# For each dataset size, starts app.py as a separate server process in a scratch copy of
+# the app (so the real reminders.json and audio folders are never touched), seeded with
+# that many pending reminders, and then for --duration seconds:
+#   - drives concurrent HTTP traffic: GET /time, GET /reminders (one page), POST and
+#     DELETE /reminders, GET /audio_files and POST /upload_audio
+#   - keeps --socket-clients python-socketio clients connected to one channel, into which
+#     --fire reminders become due spread over the run; the clients acknowledge them like
+#     the web client does
+#   - samples the server's RSS and CPU time
+# and reports per operation throughput and p50/p99 latency, the firing lag (due time to
+# 'reminder_due' receipt at the first client), the server's startup time, peak RSS and
+# CPU use.
+#
+# Usage (from the repository root; the socket clients need python-socketio[client]):
+#   python benchmarks/load_test.py --sizes 1000,10000,100000 --duration 20
+#   python benchmarks/load_test.py --sizes 1000 --duration 5 --output results.json
+# Results are printed as JSON (and written to --output), so runs can be compared to catch
+# regressions in the checker or storage path.
+import argparse
+import concurrent.futures
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# What the scratch copy of the app needs
+APP_FILES = ['app.py', 'storage.py', 'recurrence.py', 'metrics.py', 'index.html', 'script.js', 'style.css']
+APP_FOLDERS = ['default_audio']
+# Runs the app without the debug reloader, on the given port, with the checker started
+SERVER_LAUNCHER = (
+    "import signal, sys\n"
+    "import app\n"
+    "signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))\n"
+    "app.start_reminder_checker()\n"
+    "app.socketio.run(app.app, host='127.0.0.1', port=int(sys.argv[1]), log_output=False, allow_unsafe_werkzeug=True)\n"
+)
+# Relative weights of the HTTP operations
+OPERATION_WEIGHTS = {
+    'get_time': 30,
+    'list_reminders': 20,
+    'create_reminder': 15,
+    'delete_reminder': 10,
+    'list_audio_files': 15,
+    'upload_audio': 5,
+}
+BENCH_CHANNEL = 'bench'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load and latency benchmark for the alarm backend')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated numbers of seeded reminders')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load per size')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent HTTP workers')
+    parser.add_argument('--socket-clients', type=int, default=50, help='Connected python-socketio clients')
+    parser.add_argument('--fire', type=int, default=100, help='Reminders that become due during the run')
+    parser.add_argument('--upload-bytes', type=int, default=64 * 1024, help='Size of each uploaded file')
+    parser.add_argument('--storage-backend', default='journal', help='ALARM_STORAGE_BACKEND of the server')
+    parser.add_argument('--startup-timeout', type=float, default=120, help='Seconds to wait for the server to start')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the operation mix')
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    return parser.parse_args()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def latency_summary(seconds, duration=None):
+    values = sorted(seconds)
+    summary = {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.5) * 1000, 3) if values else None,
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3) if values else None,
+        'max_ms': round(values[-1] * 1000, 3) if values else None,
+    }
+    if duration:
+        summary['throughput_per_second'] = round(len(values) / duration, 2)
+    return summary
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# --- Server ---
+# Copy the app into work_dir and seed its reminders.json with count pending reminders,
+# due well after the run and spread over channels the benchmark clients don't join
+def prepare_app(work_dir, count):
+    for name in APP_FILES:
+        shutil.copy2(os.path.join(REPO_DIR, name), work_dir)
+    for name in APP_FOLDERS:
+        shutil.copytree(os.path.join(REPO_DIR, name), os.path.join(work_dir, name))
+    base = datetime.now(timezone.utc) + timedelta(days=30)
+    reminders = []
+    for i in range(count):
+        due = base + timedelta(seconds=i)
+        reminders.append({
+            'id': f'seed-{i}',
+            'text': f'Seeded reminder {i}',
+            'time': due.isoformat(),
+            'due_utc_ms': int(due.timestamp() * 1000),
+            'audio_filename': None,
+            'audio_type': None,
+            'channel': f'seed{i % 100}',
+        })
+    with open(os.path.join(work_dir, 'reminders.json'), 'w', encoding='utf-8') as f:
+        json.dump(reminders, f)
+
+
+def start_server(work_dir, port, args):
+    env = dict(os.environ)
+    env.update({
+        'ALARM_DATA_FILE': os.path.join(work_dir, 'reminders.json'),
+        'ALARM_STORAGE_BACKEND': args.storage_backend,
+        'ALARM_LOG_LEVEL': env.get('ALARM_LOG_LEVEL', 'WARNING'),
+    })
+    log_file = open(os.path.join(work_dir, 'server.log'), 'wb')
+    process = subprocess.Popen([sys.executable, '-c', SERVER_LAUNCHER, str(port)], cwd=work_dir, env=env,
+                               stdout=log_file, stderr=subprocess.STDOUT)
+    process.log_file = log_file
+    return process
+
+
+def wait_for_server(port, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} (see server.log)")
+        try:
+            status, _ = http_request(port, 'GET', '/time')
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Server did not start within {timeout} s")
+
+
+def stop_server(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    process.log_file.close()
+
+
+# RSS (bytes) and CPU time (user + system seconds) of a process, from /proc (Linux) or psutil
+def process_usage(pid):
+    try:
+        import psutil
+        proc = psutil.Process(pid)
+        cpu = proc.cpu_times()
+        return proc.memory_info().rss, cpu.user + cpu.system
+    except ImportError:
+        pass
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            rss_pages = int(f.read().split()[1])
+        ticks = os.sysconf('SC_CLK_TCK')
+        return rss_pages * os.sysconf('SC_PAGE_SIZE'), (int(fields[11]) + int(fields[12])) / ticks
+    except (OSError, ValueError, IndexError):
+        return None, None
+
+
+class ResourceSampler:
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.max_rss = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.start_time = time.monotonic()
+        _, self.start_cpu = process_usage(self.pid)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss, _ = process_usage(self.pid)
+            if rss is not None:
+                self.max_rss = max(self.max_rss or 0, rss)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        rss, cpu = process_usage(self.pid)
+        if rss is not None:
+            self.max_rss = max(self.max_rss or 0, rss)
+        elapsed = time.monotonic() - self.start_time
+        cpu_percent = None
+        if cpu is not None and self.start_cpu is not None and elapsed > 0:
+            cpu_percent = round((cpu - self.start_cpu) / elapsed * 100, 1)
+        return {
+            'rss_max_mb': round(self.max_rss / (1024 * 1024), 1) if self.max_rss else None,
+            'cpu_percent': cpu_percent,
+        }
+
+
+# --- HTTP Load ---
+def http_request(port, method, path, body=None, headers=None, timeout=30):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def json_request(port, method, path, data):
+    return http_request(port, method, path, json.dumps(data).encode('utf-8'), {'Content-Type': 'application/json'})
+
+
+def multipart_body(field, filename, content):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: audio/mpeg\r\n\r\n').encode('utf-8') + content + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+class HttpLoad:
+    def __init__(self, port, args):
+        self.port = port
+        self.args = args
+        self.latencies = {name: [] for name in OPERATION_WEIGHTS}
+        self.errors = {name: 0 for name in OPERATION_WEIGHTS}
+        self._created_ids = []
+        self._lock = threading.Lock()
+
+    def _operation(self, name, rng):
+        future_time = (datetime.now(timezone.utc) + timedelta(days=60, seconds=rng.randint(0, 86400))).isoformat()
+        if name == 'get_time':
+            return http_request(self.port, 'GET', '/time')
+        if name == 'list_reminders':
+            return http_request(self.port, 'GET', '/reminders?limit=100')
+        if name == 'list_audio_files':
+            return http_request(self.port, 'GET', '/audio_files?limit=100')
+        if name == 'delete_reminder':
+            with self._lock:
+                reminder_id = self._created_ids.pop() if self._created_ids else None
+            if reminder_id is not None:
+                return http_request(self.port, 'DELETE', f'/reminders/{reminder_id}')
+            name = 'create_reminder' # Nothing to delete yet
+        if name == 'create_reminder':
+            status, body = json_request(self.port, 'POST', '/reminders',
+                                        {'text': 'Benchmark reminder', 'time': future_time, 'channel': 'load'})
+            if status == 201:
+                with self._lock:
+                    self._created_ids.append(json.loads(body)['id'])
+            return status, body
+        if name == 'upload_audio':
+            # Mostly distinct files, with some repeats to exercise deduplication
+            content = rng.choice([b'\0', os.urandom(16)]) * (self.args.upload_bytes // 16)
+            body, headers = multipart_body('audio_file', 'bench.mp3', content)
+            return http_request(self.port, 'POST', '/upload_audio', body, headers)
+        raise ValueError(name)
+
+    def worker(self, deadline, seed):
+        rng = random.Random(seed)
+        names = list(OPERATION_WEIGHTS)
+        weights = [OPERATION_WEIGHTS[name] for name in names]
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                status, _ = self._operation(name, rng)
+                failed = status >= 400
+            except OSError:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                if failed:
+                    self.errors[name] += 1
+                else:
+                    self.latencies[name].append(elapsed)
+
+    def run(self, duration):
+        deadline = time.monotonic() + duration
+        with concurrent.futures.ThreadPoolExecutor(self.args.concurrency) as pool:
+            futures = [pool.submit(self.worker, deadline, self.args.seed + i) for i in range(self.args.concurrency)]
+            for future in futures:
+                future.result()
+
+    def results(self, duration):
+        operations = {}
+        for name in OPERATION_WEIGHTS:
+            operations[name] = latency_summary(self.latencies[name], duration)
+            operations[name]['errors'] = self.errors[name]
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        return {'operations': operations, 'total': latency_summary(all_latencies, duration),
+                'errors': sum(self.errors.values())}
+
+
+# --- Socket Clients ---
+class SocketClients:
+    def __init__(self, port, count):
+        import socketio # python-socketio[client]
+        self.port = port
+        self.clients = [socketio.Client(reconnection=False) for _ in range(count)]
+        self.first_receipt_ms = {} # delivery_id -> (receive time, due time)
+        self.frames = 0
+        self._lock = threading.Lock()
+        for client in self.clients:
+            client.on('reminder_due', self._handler(client))
+
+    def _handler(self, client):
+        def on_reminder_due(reminders):
+            received_ms = time.time() * 1000
+            with self._lock:
+                self.frames += 1
+                for reminder in reminders:
+                    key = reminder.get('delivery_id') or reminder['id']
+                    if key not in self.first_receipt_ms:
+                        self.first_receipt_ms[key] = (received_ms, reminder['due_utc_ms'])
+            ids = [r['delivery_id'] for r in reminders if r.get('delivery_id')]
+            if ids:
+                client.emit('ack_reminders', {'ids': ids})
+        return on_reminder_due
+
+    def connect(self):
+        url = f'http://127.0.0.1:{self.port}'
+        for client in self.clients:
+            client.connect(url, auth={'channel': BENCH_CHANNEL}, wait_timeout=30)
+
+    def disconnect(self):
+        for client in self.clients:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+
+    def firing_lag(self, expected):
+        with self._lock:
+            lags = sorted(max(0.0, received - due) for received, due in self.first_receipt_ms.values())
+        return {
+            'expected': expected,
+            'received': len(lags),
+            'p50_ms': round(percentile(lags, 0.5), 1) if lags else None,
+            'p99_ms': round(percentile(lags, 0.99), 1) if lags else None,
+            'max_ms': round(lags[-1], 1) if lags else None,
+            'frames': self.frames,
+        }
+
+
+# Create the reminders that fire during the run, due evenly spread over [start, end]
+def schedule_fire_reminders(port, count, start, end):
+    if count <= 0:
+        return
+    step = (end - start) / count
+    reminders = [{'text': f'Fire {i}', 'time': (start + step * i).isoformat(), 'channel': BENCH_CHANNEL}
+                 for i in range(count)]
+    status, body = json_request(port, 'POST', '/reminders:batch', reminders)
+    if status != 201:
+        raise RuntimeError(f"Could not create the reminders to fire: {status} {body[:200]!r}")
+
+
+def run_size(size, args):
+    work_dir = tempfile.mkdtemp(prefix='alarm-load-')
+    try:
+        prepare_app(work_dir, size)
+        port = free_port()
+        started = time.monotonic()
+        process = start_server(work_dir, port, args)
+        try:
+            wait_for_server(port, process, args.startup_timeout)
+            startup_seconds = time.monotonic() - started
+
+            sockets = SocketClients(port, args.socket_clients)
+            sockets.connect()
+            # The last reminders are due a little before the end, so their delivery is seen
+            now = datetime.now(timezone.utc)
+            schedule_fire_reminders(port, args.fire, now + timedelta(seconds=1),
+                                    now + timedelta(seconds=max(1.0, args.duration - 2)))
+
+            sampler = ResourceSampler(process.pid)
+            sampler.start()
+            load = HttpLoad(port, args)
+            load.run(args.duration)
+            usage = sampler.stop()
+            time.sleep(1) # Let the last deliveries arrive
+            lag = sockets.firing_lag(args.fire)
+            sockets.disconnect()
+        finally:
+            stop_server(process)
+        return {
+            'reminders': size,
+            'startup_seconds': round(startup_seconds, 3),
+            'http': load.results(args.duration),
+            'firing_lag': lag,
+            'server': usage,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    results = {
+        'python': sys.version.split()[0],
+        'duration_seconds': args.duration,
+        'concurrency': args.concurrency,
+        'socket_clients': args.socket_clients,
+        'storage_backend': args.storage_backend,
+        'runs': [],
+    }
+    for size in sizes:
+        print(f"Running with {size} reminders...", file=sys.stderr)
+        results['runs'].append(run_size(size, args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# Benchmark: cost of delivering 'reminder_due' with per-channel rooms vs. a broadcast
+#
+# Connects many in-process Socket.IO test clients spread over a number of channels,
+# then delivers the same batch of due reminders twice:
+#   rooms     - emit_due_reminders(), one emit per channel involved (current behaviour)
+#   broadcast - socketio.emit('reminder_due', all_due) to every socket (old behaviour)
+# and reports the time per delivery round and how many reminder payloads reached clients.
+#
+# Usage (from the repository root):
+#   python benchmarks/room_fanout.py --clients 1000 --channels 100 --due 200
+# Results are printed as JSON.
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark reminder_due fan-out with rooms vs. broadcast')
+    parser.add_argument('--clients', type=int, default=1000, help='Number of simulated socket clients')
+    parser.add_argument('--channels', type=int, default=100, help='Number of channels the clients are spread over')
+    parser.add_argument('--due', type=int, default=200, help='Due reminders per delivery round')
+    parser.add_argument('--rounds', type=int, default=5, help='Delivery rounds per mode')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for channel assignment')
+    return parser.parse_args()
+
+
+# Drain every client's receive queue and count the reminders delivered
+def count_deliveries(clients):
+    delivered = 0
+    for client in clients:
+        for event in client.get_received():
+            if event['name'] == 'reminder_due':
+                delivered += len(event['args'][0])
+    return delivered
+
+
+def run_mode(name, deliver, clients, due_reminders, rounds):
+    durations = []
+    delivered = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        deliver(due_reminders)
+        durations.append(time.perf_counter() - start)
+        delivered = count_deliveries(clients)
+    return {
+        'mode': name,
+        'round_seconds_median': statistics.median(durations),
+        'round_seconds_min': min(durations),
+        'reminders_delivered_per_round': delivered,
+    }
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+
+    # Keep the benchmark away from the real reminders.json and uploaded audio
+    data_dir = tempfile.mkdtemp(prefix='alarm-bench-')
+    os.environ['ALARM_DATA_FILE'] = os.path.join(data_dir, 'reminders.json')
+    os.environ['ALARM_UPLOAD_DIR'] = os.path.join(data_dir, 'uploaded_audio')
+    os.environ.setdefault('ALARM_PERSIST_MODE', 'shutdown')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as alarm_app
+
+    channels = [f'bench{i}' for i in range(args.channels)]
+    clients = [
+        alarm_app.socketio.test_client(alarm_app.app, auth={'channel': channels[i % len(channels)]})
+        for i in range(args.clients)
+    ]
+    count_deliveries(clients) # Discard connect-time events
+
+    due_reminders = [
+        {
+            'id': f'bench-{i}',
+            'text': f'Benchmark reminder {i}',
+            'time': '2000-01-01T00:00:00+00:00',
+            'due_utc_ms': 946684800000,
+            'audio_filename': None,
+            'audio_type': None,
+            'channel': random.choice(channels),
+        }
+        for i in range(args.due)
+    ]
+
+    results = {
+        'clients': args.clients,
+        'channels': args.channels,
+        'due_per_round': args.due,
+        'async_mode': alarm_app.socketio.async_mode,
+        'results': [
+            run_mode('rooms', alarm_app.emit_due_reminders, clients, due_reminders, args.rounds),
+            run_mode('broadcast', lambda due: alarm_app.socketio.emit('reminder_due', due), clients, due_reminders, args.rounds),
+        ],
+    }
+    for client in clients:
+        client.disconnect()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+# Metrics and profiling
+#
+# A small, dependency-free subset of the Prometheus client: counters, gauges and
+# histograms with labels, rendered in the Prometheus text exposition format by
+# MetricsRegistry.render() (served by GET /metrics in app.py). Metrics are registered
+# once at import time and updated from the hot paths; an update is a dict lookup and
+# an addition under a lock.
+#
+# StackSampler is the opt-in profiler: it samples the Python stacks of all threads from
+# a separate thread for a time window and aggregates them into "collapsed stack" lines
+#   frame;frame;frame count
+# as read by flamegraph.pl and speedscope. Sampling (rather than cProfile) also covers
+# the other threads and adds no overhead while it is not running. Stacks are read with
+# sys._current_frames(), which only sees OS threads: gevent greenlets share their thread,
+# so only the greenlet running at the moment of each sample shows up.
+import os
+import sys
+import threading
+import time
+
+# Default histogram buckets (seconds), suited to request and task durations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {} # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+# Counters and gauges hold one number per label set. With func, the values are instead
+# read when the metrics are rendered: func returns a number, or for labelled metrics a
+# dict {label values tuple: number}; None leaves the metric out.
+class _ValueMetric(_Metric):
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def render(self):
+        if self.func is not None:
+            value = self.func()
+            if value is None:
+                return []
+            values = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                values = sorted(self._values.items())
+            if not values and not self.labelnames:
+                values = [((), 0)]
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                                for key, value in values]
+
+
+class Counter(_ValueMetric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_ValueMetric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, sum, count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        lines = self.header()
+        for key, (bucket_counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), func=None):
+        return self._register(Counter(name, documentation, labelnames, func))
+
+    def gauge(self, name, documentation, labelnames=(), func=None):
+        return self._register(Gauge(name, documentation, labelnames, func))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    # All metrics in the Prometheus text exposition format (version 0.0.4)
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# --- Stack Sampler ---
+class StackSampler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+
+    # Sample all threads every interval seconds for duration seconds (blocking the calling
+    # thread) and return the collapsed stacks, most frequent first. Raises RuntimeError if
+    # a profile is already being taken.
+    def sample(self, duration, interval=0.005):
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A profile is already running")
+            self.running = True
+        try:
+            return self._sample(duration, interval)
+        finally:
+            self.running = False
+
+    # Run sample() in a separate OS thread, so a caller running in a gevent greenlet can
+    # wait for it cooperatively. Returns (thread, result dict filled in with 'stacks' or 'error').
+    def start(self, duration, interval=0.005):
+        result = {}
+
+        def run():
+            try:
+                result['stacks'] = self.sample(duration, interval)
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=run, name='stack-sampler', daemon=True)
+        thread.start()
+        return thread, result
+
+    def _sample(self, duration, interval):
+        own_thread = threading.get_ident()
+        counts = {}
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, f'thread-{thread_id}'))
+                key = ';'.join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            time.sleep(interval)
+        lines = [f"{stack} {count}" for stack, count in sorted(counts.items(), key=lambda item: -item[1])]
+        return '\n'.join(lines) + '\n' if lines else ''
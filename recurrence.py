@@ -0,0 +1,224 @@
+# Recurring reminders
+#
+# A recurring reminder is stored as a single record: its 'time'/'due_utc_ms' are those of
+# the next occurrence and its 'recurrence' dict holds the rule. When the reminder fires,
+# advance_reminder() computes the following occurrence and the record is updated in place,
+# so the number of records (and the size of the data file) grows with the number of rules,
+# never with the number of occurrences.
+#
+# Rules follow the iCalendar RRULE subset that alarms need:
+#   freq       - 'daily', 'weekly' or 'monthly'
+#   interval   - every N days/weeks/months (default 1)
+#   byweekday  - weekly only: weekdays to ring on, 0=Monday .. 6=Sunday
+#                (default: the weekday of the first occurrence)
+#   until      - no occurrence after this time (ISO 8601)
+#   count      - total number of occurrences, including the first one
+#   tz         - IANA timezone the rule is evaluated in, so a 07:00 alarm stays at 07:00
+#                across DST changes (default: the fixed UTC offset of the first 'time')
+# Monthly rules ring on the day of the month of the first occurrence and, like RRULE,
+# skip months that don't have that day.
+#
+# Clients may send the rule as a dict with the fields above or as an RRULE string such as
+# 'FREQ=WEEKLY;BYDAY=MO,WE,FR;COUNT=10'. parse_recurrence() turns both into the stored dict:
+#   {'freq', 'interval', 'byweekday', 'until', 'until_utc_ms', 'count', 'tz', 'dtstart'}
+# where 'dtstart' is the first occurrence (ISO 8601 with offset) that anchors the rule.
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError: # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = KeyError
+
+from storage import due_ms_from_time, parse_reminder_time
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+WEEKDAY_CODES = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+# Upper bound on the days scanned for one occurrence (a Feb 29 monthly rule with a long interval is the worst case)
+MAX_SCAN_DAYS = 366 * 8
+# Upper bound on occurrences skipped at once when catching up after downtime
+MAX_SKIPPED_OCCURRENCES = 100000
+
+
+# Parse an RRULE string ('FREQ=DAILY;INTERVAL=2', optionally prefixed with 'RRULE:') into a rule dict
+def parse_rrule_string(rrule):
+    rrule = rrule.strip()
+    if rrule.upper().startswith('RRULE:'):
+        rrule = rrule[6:]
+    rule = {}
+    for part in rrule.split(';'):
+        if not part:
+            continue
+        key, sep, value = part.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid RRULE part: {part!r}")
+        key = key.strip().upper()
+        value = value.strip()
+        if key == 'FREQ':
+            rule['freq'] = value.lower()
+        elif key == 'INTERVAL':
+            rule['interval'] = value
+        elif key == 'COUNT':
+            rule['count'] = value
+        elif key == 'UNTIL':
+            # RRULE's basic format (20250131T070000Z) -> ISO 8601
+            if len(value) >= 15 and value[8] == 'T' and '-' not in value:
+                value = f"{value[0:4]}-{value[4:6]}-{value[6:8]}T{value[9:11]}:{value[11:13]}:{value[13:15]}{value[15:]}"
+            elif len(value) == 8 and value.isdigit():
+                value = f"{value[0:4]}-{value[4:6]}-{value[6:8]}T23:59:59Z"
+            rule['until'] = value
+        elif key == 'BYDAY':
+            rule['byweekday'] = [day.strip() for day in value.split(',') if day.strip()]
+        elif key == 'TZID':
+            rule['tz'] = value
+        else:
+            raise ValueError(f"Unsupported RRULE part: {key}")
+    return rule
+
+
+def _parse_weekday(value):
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 6:
+        return value
+    if isinstance(value, str) and value.strip().upper()[:2] in WEEKDAY_CODES:
+        return WEEKDAY_CODES.index(value.strip().upper()[:2])
+    raise ValueError(f"Invalid weekday: {value!r}")
+
+
+def _positive_int(value, name):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a positive integer")
+    if value < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return value
+
+
+# Return the timezone a rule is evaluated in
+def rule_timezone(rule):
+    if rule.get('tz'):
+        return ZoneInfo(rule['tz'])
+    return parse_reminder_time(rule['dtstart']).tzinfo
+
+
+# Validate a rule sent by a client (dict or RRULE string) and return the stored form.
+# time_str is the reminder's first occurrence; tz_name an optional IANA timezone sent
+# alongside the rule. Raises ValueError if the rule is invalid.
+def parse_recurrence(value, time_str, tz_name=None):
+    if isinstance(value, str):
+        value = parse_rrule_string(value)
+    if not isinstance(value, dict):
+        raise ValueError("recurrence must be an object or an RRULE string")
+
+    freq = str(value.get('freq', '')).lower()
+    if freq not in FREQUENCIES:
+        raise ValueError(f"recurrence freq must be one of {', '.join(FREQUENCIES)}")
+    interval = _positive_int(value.get('interval', 1), "recurrence interval")
+    count = value.get('count')
+    if count is not None:
+        count = _positive_int(count, "recurrence count")
+
+    tz_name = value.get('tz') or tz_name
+    if tz_name:
+        if not isinstance(tz_name, str):
+            raise ValueError("timezone must be an IANA timezone name")
+        if ZoneInfo is None:
+            raise ValueError("Timezones need Python 3.9 or newer")
+        try:
+            zone = ZoneInfo(tz_name)
+        except (ZoneInfoNotFoundError, ValueError, TypeError):
+            raise ValueError(f"Unknown timezone: {tz_name!r}")
+    # The first occurrence, as wall-clock time in the rule's timezone
+    if not isinstance(time_str, str):
+        raise ValueError("recurrence dtstart must be an ISO 8601 string")
+    dtstart = parse_reminder_time(time_str)
+    if tz_name:
+        dtstart = dtstart.astimezone(zone)
+
+    byweekday = None
+    if freq == 'weekly':
+        days = value.get('byweekday') or [dtstart.weekday()]
+        if not isinstance(days, (list, tuple)):
+            days = [days]
+        byweekday = sorted({_parse_weekday(day) for day in days})
+
+    until = value.get('until')
+    until_utc_ms = None
+    if until is not None:
+        until_utc_ms = due_ms_from_time(until)
+
+    return {
+        'freq': freq,
+        'interval': interval,
+        'byweekday': byweekday,
+        'until': until,
+        'until_utc_ms': until_utc_ms,
+        'count': count,
+        'tz': tz_name or None,
+        'dtstart': dtstart.isoformat(),
+    }
+
+
+def _matches(rule, day, start):
+    interval = rule['interval']
+    if rule['freq'] == 'daily':
+        return (day - start).days % interval == 0
+    if rule['freq'] == 'weekly':
+        if day.weekday() not in rule['byweekday']:
+            return False
+        start_monday = start - timedelta(days=start.weekday())
+        return ((day - start_monday).days // 7) % interval == 0
+    # monthly
+    if day.day != start.day:
+        return False
+    return ((day.year - start.year) * 12 + day.month - start.month) % interval == 0
+
+
+# Return the first occurrence of the rule strictly after after_ms (epoch milliseconds),
+# ignoring 'count' and 'until', or None if none is found within MAX_SCAN_DAYS
+def next_occurrence_ms(rule, after_ms):
+    zone = rule_timezone(rule)
+    dtstart = parse_reminder_time(rule['dtstart']).astimezone(zone)
+    start = dtstart.date()
+    wall_time = dtstart.timetz().replace(tzinfo=None)
+    after_local = datetime.fromtimestamp(after_ms / 1000.0, timezone.utc).astimezone(zone)
+    # An occurrence on the same local date can still be later in the day (never before dtstart)
+    day = max(after_local.date(), start)
+    for _ in range(MAX_SCAN_DAYS):
+        if _matches(rule, day, start):
+            occurrence = datetime.combine(day, wall_time, tzinfo=zone)
+            occurrence_ms = int(round(occurrence.timestamp() * 1000))
+            if occurrence_ms > after_ms:
+                return occurrence_ms
+        day += timedelta(days=1)
+    return None
+
+
+# Return the reminder moved to its next occurrence after it fired, or None if the series
+# has ended. Occurrences that are already past at now_ms (e.g. the server was down) are
+# skipped but still count towards 'count'. The given reminder is not modified.
+def advance_reminder(reminder, now_ms):
+    rule = reminder.get('recurrence')
+    if not rule or reminder.get('due_utc_ms') is None:
+        return None
+    occurrence = reminder.get('occurrence', 1)
+    due_ms = reminder['due_utc_ms']
+    for _ in range(MAX_SKIPPED_OCCURRENCES):
+        due_ms = next_occurrence_ms(rule, due_ms)
+        occurrence += 1
+        if due_ms is None:
+            return None
+        if rule.get('count') is not None and occurrence > rule['count']:
+            return None
+        if rule.get('until_utc_ms') is not None and due_ms > rule['until_utc_ms']:
+            return None
+        if due_ms > now_ms:
+            break
+    else:
+        return None
+    zone = rule_timezone(rule)
+    next_reminder = dict(reminder)
+    next_reminder['time'] = datetime.fromtimestamp(due_ms / 1000.0, timezone.utc).astimezone(zone).isoformat()
+    next_reminder['due_utc_ms'] = due_ms
+    next_reminder['occurrence'] = occurrence
+    return next_reminder
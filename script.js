@@ -4,16 +4,21 @@ window.onload = function() {
     // Connect to Socket.IO server
     // Since Electron loads directly from the backend URL (e.g., http://127.0.0.1:5000),
     // io() without arguments should connect to the same origin.
-    console.log('Attempting to connect to Socket.IO server...');
-    const socket = io();
+    // The channel (owner key) decides which reminders this window shows and gets notified about.
+    // It can be chosen with ?channel=... in the URL and is remembered in localStorage.
+    const urlChannel = new URLSearchParams(window.location.search).get('channel');
+    const reminderChannel = urlChannel || localStorage.getItem('reminderChannel') || 'default';
+    localStorage.setItem('reminderChannel', reminderChannel);
+    console.log('Attempting to connect to Socket.IO server with channel:', reminderChannel);
+    const socket = io({ auth: { channel: reminderChannel } });
 
 
     // Socket.IO event handlers
     socket.on('connect', function() {
         console.log('Socket.IO: Connected to server!');
-        // Once connected, fetch initial data and show the main layout
-        fetchReminders();
-        fetchAndDisplayServerTime(); // Start clock updates
+        // Once connected, sync the reminder list and show the main layout
+        syncReminders();
+        startClockSync(); // Start clock updates
         // displayAudioFiles(); // Audio files are displayed when right sidebar opens
 
         // Show the main application layout after successful connection
@@ -54,9 +59,48 @@ window.onload = function() {
     });
 
 
+    // Delivery ids of the due reminders already shown. The server sends a reminder again
+    // until it is acknowledged, so the same one can arrive twice (e.g. after a reconnect);
+    // it is acknowledged again but not shown again. Kept in localStorage across reloads.
+    const MAX_SEEN_DELIVERIES = 500;
+    let seenDeliveryIds = [];
+    try {
+        seenDeliveryIds = JSON.parse(localStorage.getItem('seenDeliveryIds')) || [];
+    } catch (e) {
+        seenDeliveryIds = [];
+    }
+    const seenDeliveries = new Set(seenDeliveryIds);
+
+    // Returns true if the delivery was not seen before
+    function rememberDelivery(deliveryId) {
+        if (seenDeliveries.has(deliveryId)) {
+            return false;
+        }
+        seenDeliveries.add(deliveryId);
+        seenDeliveryIds.push(deliveryId);
+        while (seenDeliveryIds.length > MAX_SEEN_DELIVERIES) {
+            seenDeliveries.delete(seenDeliveryIds.shift());
+        }
+        localStorage.setItem('seenDeliveryIds', JSON.stringify(seenDeliveryIds));
+        return true;
+    }
+
     // Listen for 'reminder_due' event from the server
-    socket.on('reminder_due', function(dueReminders) {
-        console.log('Socket.IO: Received reminder_due event with data:', dueReminders);
+    socket.on('reminder_due', function(receivedReminders) {
+        console.log('Socket.IO: Received reminder_due event with data:', receivedReminders);
+        let dueReminders = receivedReminders;
+        if (receivedReminders && Array.isArray(receivedReminders)) {
+            // Acknowledge the delivery so the server stops re-sending it
+            const deliveryIds = receivedReminders.map(reminder => reminder.delivery_id).filter(Boolean);
+            if (deliveryIds.length > 0) {
+                socket.emit('ack_reminders', { ids: deliveryIds });
+            }
+            dueReminders = receivedReminders.filter(reminder => !reminder.delivery_id || rememberDelivery(reminder.delivery_id));
+            if (receivedReminders.length > 0 && dueReminders.length === 0) {
+                console.log('Socket.IO: Ignoring reminders that were already shown.');
+                return;
+            }
+        }
         if (dueReminders && Array.isArray(dueReminders) && dueReminders.length > 0) {
             console.log('Socket.IO: Processing due reminders...');
             let notificationMessage = "Nhắc nhở đến hạn!\n\n";
@@ -73,7 +117,7 @@ window.onload = function() {
             // Check for audio_filename and audio_type provided by the backend
             if (dueReminders[0] && dueReminders[0].audio_filename && dueReminders[0].audio_type) {
                  // Construct URL to audio file based on type (backend serves from correct folder)
-                 const audioUrl = `/${dueReminders[0].audio_type}/${dueReminders[0].audio_filename}`;
+                 const audioUrl = reminderAudioUrl(dueReminders[0]);
                  console.log('Socket.IO: Playing audio from filename:', dueReminders[0].audio_filename, 'Type:', dueReminders[0].audio_type, 'URL:', audioUrl);
                  playNotificationSound(audioUrl);
             } else {
@@ -83,18 +127,103 @@ window.onload = function() {
                  playNotificationSound(defaultAudioUrl);
             }
 
-            // Refresh the reminder list on the frontend after due reminders are processed
-            console.log('Socket.IO: Fetching reminders to update list...');
-            fetchReminders();
+            // The list itself is updated by the 'reminders_fired' event that follows
         } else {
             console.warn('Socket.IO: Received reminder_due event with no or invalid due reminders data:', dueReminders);
         }
     });
 
 
+    // --- Reminder change feed ---
+    // The server broadcasts every change as a small delta with an increasing seq number.
+    // We apply them to localReminders instead of re-fetching the whole list.
+    let lastSeq = null; // Seq of the last change applied
+    let serverInstanceId = null; // Changes when the backend restarts, forcing a full sync
+    let syncInProgress = false;
+    let bufferedChanges = []; // Deltas received while a sync request is in flight
+
+    // Ask the server for the changes we missed (or the full list on first connect)
+    function syncReminders() {
+        if (syncInProgress) {
+            return;
+        }
+        syncInProgress = true;
+        console.log('Socket.IO: Syncing reminders since seq', lastSeq);
+        socket.emit('sync', { since_seq: lastSeq, instance_id: serverInstanceId }, function(reply) {
+            syncInProgress = false;
+            if (!reply) {
+                console.error('Socket.IO: Empty sync reply, falling back to fetch.');
+                fetchReminders();
+                return;
+            }
+            serverInstanceId = reply.instance_id;
+            if (reply.reset) {
+                console.log(`Socket.IO: Full sync with ${reply.reminders.length} reminders at seq ${reply.seq}`);
+                localReminders = reply.reminders;
+                lastSeq = reply.seq;
+            } else {
+                console.log(`Socket.IO: Catching up with ${reply.changes.length} changes to seq ${reply.seq}`);
+                reply.changes.forEach(change => applyChange(change.event, change.data));
+            }
+            // Apply deltas that arrived while waiting for the reply
+            const pending = bufferedChanges;
+            bufferedChanges = [];
+            pending.forEach(change => applyChange(change.event, change.data));
+            sortAndDisplayReminders();
+        });
+    }
+
+    // Apply one delta to localReminders (returns false if it was already applied)
+    function applyChange(event, data) {
+        if (lastSeq !== null && data.seq <= lastSeq) {
+            return false; // Already contained in what we have
+        }
+        if (event === 'reminder_added' || event === 'reminder_updated') {
+            localReminders = localReminders.filter(rem => rem.id !== data.reminder.id);
+            localReminders.push(data.reminder);
+        } else if (event === 'reminders_added') {
+            const addedIds = new Set(data.reminders.map(rem => rem.id));
+            localReminders = localReminders.filter(rem => !addedIds.has(rem.id)).concat(data.reminders);
+        } else if (event === 'reminder_deleted') {
+            localReminders = localReminders.filter(rem => rem.id !== data.id);
+        } else if (event === 'reminders_deleted') {
+            const deletedIds = new Set(data.ids);
+            localReminders = localReminders.filter(rem => !deletedIds.has(rem.id));
+        } else if (event === 'reminders_fired') {
+            const firedIds = new Set(data.ids);
+            localReminders = localReminders.filter(rem => !firedIds.has(rem.id));
+        }
+        lastSeq = data.seq;
+        return true;
+    }
+
+    // Handle a delta pushed by the server
+    function handleChangeEvent(event, data) {
+        if (syncInProgress) {
+            bufferedChanges.push({ event: event, data: data });
+            return;
+        }
+        if (lastSeq === null || data.seq > lastSeq + 1) {
+            // We missed something (or never synced): catch up instead of applying out of order
+            console.warn(`Socket.IO: Gap in change feed (have ${lastSeq}, got ${data.seq}). Resyncing.`);
+            syncReminders();
+            return;
+        }
+        if (applyChange(event, data)) {
+            sortAndDisplayReminders();
+        }
+    }
+
+    ['reminder_added', 'reminders_added', 'reminder_updated', 'reminder_deleted', 'reminders_deleted', 'reminders_fired'].forEach(event => {
+        socket.on(event, data => handleChangeEvent(event, data));
+    });
+
+
     // Get references to main UI elements
     const reminderText = document.getElementById('reminder-text');
     const reminderTime = document.getElementById('reminder-time');
+    const reminderRecurrence = document.getElementById('reminder-recurrence');
+    const RECURRENCE_LABELS = { daily: 'Hằng ngày', weekly: 'Hằng tuần', monthly: 'Hằng tháng' };
     const addReminderBtn = document.getElementById('add-reminder-btn');
     const digitalClockElement = document.getElementById('digital-clock');
     const overlay = document.querySelector('.overlay');
@@ -196,36 +325,66 @@ window.onload = function() {
         }
     }
 
-    // Function to fetch and display server time
-    async function fetchAndDisplayServerTime() {
-        // console.log('Clock: Attempting to fetch server time...');
-        try {
-            const response = await fetch('/time');
-            // console.log('Clock: Fetch response received:', response);
+    // --- Clock synchronization ---
+    // Instead of polling GET /time every second, we estimate the offset between the
+    // local clock and the server clock over the Socket.IO connection (NTP style):
+    // a few samples on connect, then a resync every CLOCK_RESYNC_INTERVAL_MS.
+    // The displayed clock ticks locally using Date.now() + clockOffsetMs.
+    const CLOCK_SYNC_SAMPLES = 5;
+    const CLOCK_SYNC_TIMEOUT_MS = 5000;
+    const CLOCK_RESYNC_INTERVAL_MS = 5 * 60 * 1000;
+    let clockOffsetMs = 0; // Server time minus local time
+    let clockTickTimer = null;
+    let clockResyncTimer = null;
+
+    // Take one offset/RTT sample. Resolves with { offset, rtt } or null on timeout.
+    function sampleServerClock() {
+        return new Promise(resolve => {
+            const t0 = Date.now();
+            socket.timeout(CLOCK_SYNC_TIMEOUT_MS).emit('clock_sync', { client_time: t0 }, (err, reply) => {
+                const t3 = Date.now();
+                if (err || !reply || typeof reply.server_time !== 'number') {
+                    resolve(null);
+                    return;
+                }
+                // Assume the reply was stamped half way through the round trip
+                resolve({ offset: reply.server_time - (t0 + t3) / 2, rtt: t3 - t0 });
+            });
+        });
+    }
 
-            if (!response.ok) {
-                console.error(`Clock: HTTP error fetching server time! status: ${response.status}`); // Log HTTP error status
-                // throw new Error(`HTTP error! status: ${response.status}`); // Don't throw, just log error
-                 return; // Stop execution if fetch fails
+    // Take several samples and keep the one with the smallest round trip (least queuing noise)
+    async function syncServerClock() {
+        let best = null;
+        for (let i = 0; i < CLOCK_SYNC_SAMPLES; i++) {
+            const sample = await sampleServerClock();
+            if (sample && (!best || sample.rtt < best.rtt)) {
+                best = sample;
             }
-            const data = await response.json();
-            // console.log('Clock: Server time data received:', data);
+        }
+        if (best) {
+            clockOffsetMs = best.offset;
+            console.log(`Clock: Synced with server, offset ${Math.round(best.offset)} ms, RTT ${best.rtt} ms`);
+        } else {
+            console.warn('Clock: Could not sync with server, keeping previous offset.');
+        }
+    }
 
-            if (data && data.server_time) {
-                 // console.log('Clock: Server time fetched successfully:', data.server_time);
-                 displayDigitalClock(data.server_time); // Display the fetched time
-            } else {
-                 console.error('Clock: Server time data is missing or invalid in response:', data); // Log if data is missing
-                 // Fallback to local time if server time data is missing
-                 const now = new Date();
-                 displayDigitalClock(now.toISOString()); // Display local time
-            }
+    // Redraw the clock at the start of every local second
+    function tickClock() {
+        const now = Date.now() + clockOffsetMs;
+        displayDigitalClock(new Date(now).toISOString());
+        clockTickTimer = setTimeout(tickClock, 1000 - (now % 1000));
+    }
 
-        } catch (error) {
-            console.error('Clock: Error fetching server time:', error);
-            // Fallback to local time if server time fetch fails
-            const now = new Date();
-            displayDigitalClock(now.toISOString()); // Display local time
+    // Start (or restart after a reconnect) the clock sync and the local ticking
+    function startClockSync() {
+        syncServerClock();
+        if (clockTickTimer === null) {
+            tickClock();
+        }
+        if (clockResyncTimer === null) {
+            clockResyncTimer = setInterval(syncServerClock, CLOCK_RESYNC_INTERVAL_MS);
         }
     }
 
@@ -466,7 +625,7 @@ window.onload = function() {
         console.log('Fetching reminders...');
         // No user check needed in this non-multiuser version
         try {
-            const response = await fetch('/reminders');
+            const response = await fetch(`/reminders?channel=${encodeURIComponent(reminderChannel)}`);
             if (!response.ok) {
                 console.error(`Error fetching reminders: HTTP error! status: ${response.status}`);
                  showNotification('Không thể tải danh sách nhắc nhở.', 'error');
@@ -479,15 +638,7 @@ window.onload = function() {
             // Update localReminders with backend data
             localReminders = reminders;
 
-            // Sort reminders by time before displaying
-            localReminders.sort((a, b) => {
-                const timeA = new Date(a.time).getTime();
-                const timeB = new Date(b.time).getTime();
-                return timeA - timeB; // Sort in ascending order of time
-            });
-            console.log('Reminders sorted by time:', localReminders);
-
-            displayReminders(localReminders); // Display the fetched and sorted list
+            sortAndDisplayReminders(); // Display the fetched and sorted list
             return localReminders; // Return the fetched reminders
         } catch (error) {
             console.error('Error fetching reminders:', error);
@@ -497,6 +648,44 @@ window.onload = function() {
         }
     }
 
+    // Function to sort localReminders by time and display them
+    function sortAndDisplayReminders() {
+        localReminders.sort((a, b) => {
+            const timeA = a.due_utc_ms != null ? a.due_utc_ms : new Date(a.time).getTime();
+            const timeB = b.due_utc_ms != null ? b.due_utc_ms : new Date(b.time).getTime();
+            return timeA - timeB; // Sort in ascending order of time
+        });
+        displayReminders(localReminders);
+        prefetchReminderAudio(localReminders);
+    }
+
+    // URL of a reminder's sound. Uploads are requested as their small fast-start variant,
+    // which the server falls back from to the original if it has none.
+    function reminderAudioUrl(reminder) {
+        const url = `/${reminder.audio_type}/${reminder.audio_filename}`;
+        return reminder.audio_type === 'uploaded_audio' ? `${url}?variant=fast` : url;
+    }
+
+    // Load the sounds of pending reminders into the HTTP cache ahead of time, so playback
+    // starts from the cache when 'reminder_due' arrives (uploads are served as immutable)
+    const prefetchedAudioUrls = new Set();
+    function prefetchReminderAudio(reminders) {
+        reminders.forEach(reminder => {
+            if (!reminder.audio_filename || !reminder.audio_type) {
+                return;
+            }
+            const url = reminderAudioUrl(reminder);
+            if (prefetchedAudioUrls.has(url)) {
+                return;
+            }
+            prefetchedAudioUrls.add(url);
+            fetch(url).then(response => response.blob()).catch(error => {
+                console.warn('Could not prefetch audio:', url, error);
+                prefetchedAudioUrls.delete(url);
+            });
+        });
+    }
+
     // Function to display reminders in the UI
     function displayReminders(reminders) {
         console.log('Displaying reminders:', reminders);
@@ -522,6 +711,11 @@ window.onload = function() {
                     <li><strong>Thời gian:</strong> ${displayTime}</li>
             `;
 
+            // Add the repeat rule of recurring reminders
+            if (reminder.recurrence) {
+                 reminderHtml += `<li><strong>Lặp lại:</strong> ${RECURRENCE_LABELS[reminder.recurrence.freq] || reminder.recurrence.freq}</li>`;
+            }
+
             // Add audio information if available
             if (reminder.audio_filename && reminder.audio_type) {
                  const audioTypeText = reminder.audio_type === 'default_audio' ? 'Có sẵn' : 'Tải lên';
@@ -548,6 +742,7 @@ window.onload = function() {
 
         const text = reminderText.value.trim();
         const time = reminderTime.value; // datetime-local input gives YYYY-MM-DDTHH:MM format
+        const recurrenceFreq = reminderRecurrence ? reminderRecurrence.value : ''; // '', 'daily', 'weekly' or 'monthly'
         // Get the selected audio filename and type from the variable
         const audioFilename = selectedAudio.filename;
         const audioType = selectedAudio.type;
@@ -580,8 +775,14 @@ window.onload = function() {
             text: text,
             time: timeISOString, // Send time in ISO format (UTC)
             audio_filename: audioFilename, // Include the selected audio filename (can be null)
-            audio_type: audioType // Include the selected audio type (can be null)
+            audio_type: audioType, // Include the selected audio type (can be null)
+            channel: reminderChannel // Only clients of this channel are notified
         };
+        if (recurrenceFreq) {
+            // The server repeats the reminder itself; our timezone keeps it at the same local time across DST
+            reminderData.recurrence = { freq: recurrenceFreq };
+            reminderData.timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+        }
          console.log('Reminder data to send:', reminderData);
 
 
@@ -601,7 +802,7 @@ window.onload = function() {
                 console.log('Backend returned:', addedReminder);
 
                 showNotification('Đã thêm nhắc nhở thành công!', 'info');
-                fetchReminders(); // Refresh the list after successful add
+                // The list is updated by the 'reminder_added' event the server broadcasts
 
             } else {
                 // Handle errors from the backend
@@ -643,7 +844,7 @@ window.onload = function() {
                     console.log('Reminder deleted from backend successfully');
                     showNotification('Đã xóa nhắc nhở.', 'info');
                     // Backend deleting the associated file is handled on the server side now.
-                    // fetchReminders(); // No longer strictly needed as SocketIO will trigger fetchReminders
+                    // Other clients drop the reminder when they receive the 'reminder_deleted' event
                 } else {
                      // Handle errors from the backend
                      const error = await response.json();
@@ -969,11 +1170,8 @@ window.onload = function() {
 
     // --- Initial Setup ---
     // These functions are now called on socket.on('connect')
-    // fetchReminders();
-    // fetchAndDisplayServerTime();
-
-    // Start clock updates only after connecting
-    // setInterval(fetchAndDisplayServerTime, 1000); // This interval is started in socket.on('connect')
+    // syncReminders();
+    // startClockSync(); // Ticks the clock locally and resyncs with the server every few minutes
 
     console.log('Script finished setting up listeners and intervals.');
     updateSelectedAudioDisplay(); // Initial display for selected audio
@@ -998,88 +1196,3 @@ window.onload = function() {
     // The logic to show main-layout is moved to socket.on('connect')
 
 }; // End of window.onload
-
-    // Get references to main UI elements
-    // ... other element references ...
-    const digitalClockElement = document.getElementById('digital-clock');
-    // ... other element references ...
-
-    // ... other functions like showNotification, showCustomPopup, hideCustomPopup, etc. ...
-
-
-    // Function to display the digital clock with provided time from backend
-    function displayDigitalClock(timeString) {
-        if (digitalClockElement) {
-            try {
-                // Use the time string from the server to create a Date object
-                const now = new Date(timeString);
-                console.log('Clock: Parsed Date object from server time:', now); // Log the parsed Date object
-
-                const hours = String(now.getHours()).padStart(2, '0');
-                const minutes = String(now.getMinutes()).padStart(2, '0');
-                const seconds = String(now.getSeconds()).padStart(2, '0');
-
-                const day = String(now.getDate()).padStart(2, '0');
-                const month = String(now.getMonth() + 1).padStart(2, '0'); // Month is 0-indexed
-                const year = now.getFullYear();
-
-                const formattedTimeString = `${hours}:${minutes}:${seconds}`;
-                const dateString = `${day}/${month}/${year}`;
-
-                digitalClockElement.innerHTML = `<span class="time">${formattedTimeString}</span><br><span class="date">${dateString}</span>`;
-                console.log('Clock: Digital clock updated with server time:', timeString); // Keep this log less frequent if needed
-            } catch (e) {
-                 console.error("Error updating digital clock:", e);
-                 digitalClockElement.textContent = "Error";
-            }
-
-        } else {
-            console.error('Clock: Digital clock element not found!');
-        }
-    }
-
-    // Function to fetch and display server time
-    async function fetchAndDisplayServerTime() {
-         console.log('Clock: Attempting to fetch server time...');
-        try {
-            const response = await fetch('/time');
-             console.log('Clock: Fetch response received:', response);
-
-            if (!response.ok) {
-                console.error(`Clock: HTTP error fetching server time! status: ${response.status}`); // Log HTTP error status
-                // Don't throw here, just log error and potentially fallback
-                 // Fallback to local time if server time fetch fails or status is not ok
-                 const now = new Date();
-                 displayDigitalClock(now.toISOString()); // Display local time as fallback
-                 return; // Stop execution if fetch fails
-            }
-            const data = await response.json();
-             console.log('Clock: Server time data received:', data);
-
-            if (data && data.server_time) {
-                 console.log('Clock: Server time fetched successfully:', data.server_time);
-                 displayDigitalClock(data.server_time); // Display the fetched time
-            } else {
-                 console.error('Clock: Server time data is missing or invalid in response:', data); // Log if data is missing
-                 // Fallback to local time if server time data is missing
-                 const now = new Date();
-                 displayDigitalClock(now.toISOString()); // Display local time
-            }
-
-        } catch (error) {
-            console.error('Clock: Error fetching server time:', error);
-            // Fallback to local time if server time fetch fails
-            const now = new Date();
-            displayDigitalClock(now.toISOString()); // Display local time
-        }
-    }
-
-    // --- Initial Setup (inside window.onload) ---
-    // ... other initial setup ...
-
-    // Fetch and display server time immediately and then every second
-    fetchAndDisplayServerTime(); // Initial call
-    setInterval(fetchAndDisplayServerTime, 1000); // Update every 1000 milliseconds (1 second)
-
-    // ... rest of the window.onload function ...
-
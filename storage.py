@@ -0,0 +1,431 @@
+# Storage backends for reminders
+#
+# The ReminderStore in app.py keeps all reminders in memory and hands batches of
+# changes to one of these backends. Every backend implements:
+#   load()                     -> list of reminder dicts
+#   save(reminders)            -> replace everything on disk with the given list
+#   write(changes, snapshot)   -> persist a batch of changes; snapshot() returns the full list
+#   needs_compaction()         -> True when compact() should be run in the background
+#   compact(snapshot)          -> fold accumulated changes into a fresh snapshot
+#   close()
+# A change is one of:
+#   ('add', reminder)          - reminder was added or replaced
+#   ('delete', reminder_id)    - reminder was deleted by a client
+#   ('fired', [reminder_ids])  - reminders were delivered and removed by the checker
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+
+logger = logging.getLogger('alarm.storage')
+
+
+# --- Time Parsing ---
+# Function to parse a reminder time string into a timezone-aware datetime
+# Raises ValueError if the string is missing or is not a valid ISO 8601 time
+def parse_reminder_time(time_str):
+    if not time_str:
+        raise ValueError("Reminder has no time")
+    if not isinstance(time_str, str):
+        raise ValueError("Reminder time must be an ISO 8601 string")
+    # Handle potential missing timezone info gracefully
+    if time_str.endswith('Z'):
+        time_str = time_str.replace('Z', '+00:00')
+    elif '+' not in time_str and '-' not in time_str[1:]: # Simple check for missing offset
+        # Assume UTC if no timezone info provided
+        time_str += '+00:00'
+    reminder_time = datetime.fromisoformat(time_str)
+    if reminder_time.tzinfo is None:
+        # Offset check above can be fooled by the date separators, so assume UTC here as well
+        reminder_time = reminder_time.replace(tzinfo=timezone.utc)
+    return reminder_time
+
+
+# Function returning the canonical UTC due time (epoch milliseconds) for a time string
+# Raises ValueError if the string cannot be parsed
+def due_ms_from_time(time_str):
+    if not isinstance(time_str, str):
+        raise ValueError("Reminder time must be an ISO 8601 string")
+    return int(round(parse_reminder_time(time_str).timestamp() * 1000))
+
+
+# Give legacy records without an id one (as the app does when it loads them), so an
+# import into a backend keyed by id keeps them. Returns the list.
+def assign_missing_ids(reminders):
+    missing = [reminder for reminder in reminders if not reminder.get('id')]
+    for reminder in missing:
+        reminder['id'] = str(uuid.uuid4())
+    if missing:
+        logger.warning("Assigned new ids to %s imported reminders that had none.", len(missing))
+    return reminders
+
+
+# Function to make sure a stored reminder carries its normalized due time.
+# Legacy records only have the 'time' string; they get 'due_utc_ms' computed once here.
+# Records whose time cannot be parsed get 'due_utc_ms': None so they are never scheduled.
+# Returns True if the record was changed.
+def normalize_reminder_time(reminder):
+    if 'due_utc_ms' in reminder:
+        return False
+    try:
+        reminder['due_utc_ms'] = due_ms_from_time(reminder.get('time'))
+    except ValueError as e:
+        logger.warning("Reminder ID %s has an invalid time %r: %s. It will not fire.", reminder.get('id', 'N/A'), reminder.get('time'), e)
+        reminder['due_utc_ms'] = None
+    return True
+
+
+# Function returning a reminder's due time as a UTC POSIX timestamp
+# Raises ValueError if the reminder has no valid time
+def reminder_due_timestamp(reminder):
+    due_utc_ms = reminder.get('due_utc_ms')
+    if due_utc_ms is None:
+        if 'due_utc_ms' in reminder:
+            raise ValueError(f"Reminder has an invalid time: {reminder.get('time')!r}")
+        return parse_reminder_time(reminder.get('time')).timestamp()
+    return due_utc_ms / 1000.0
+
+
+# Write data as JSON to path via a temporary file and an atomic rename
+def write_json_atomic(path, data, indent=None):
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False) # ensure_ascii=False to save non-ASCII chars directly
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+
+# Read a reminders.json style file (a JSON list of reminder objects)
+def read_reminders_file(path):
+    logger.debug("Attempting to load reminders from %s", path)
+    if not os.path.exists(path):
+        logger.info("Data file not found: %s. Returning empty list.", path)
+        return []
+    try:
+        # Open and read the data file with utf-8 encoding
+        with open(path, 'r', encoding='utf-8') as f:
+            # Load JSON data from the file
+            reminders = json.load(f)
+            logger.info("Loaded %s reminders from %s", len(reminders), path)
+            return reminders
+    except json.JSONDecodeError:
+        logger.exception("Error decoding JSON from %s. File might be corrupt. Returning empty list.", path)
+        return []
+    except IOError as e:
+        logger.exception("Error reading data file %s: %s", path, e)
+        return []
+
+
+# Apply a list of changes to a dict of reminders keyed by id
+def apply_changes(reminders_by_id, changes):
+    for op, payload in changes:
+        if op == 'add':
+            reminders_by_id[payload['id']] = payload
+        elif op == 'delete':
+            reminders_by_id.pop(payload, None)
+        elif op == 'fired':
+            for reminder_id in payload:
+                reminders_by_id.pop(reminder_id, None)
+
+
+# --- JSON file backend ---
+# The original format: the whole list lives in reminders.json and every flush
+# rewrites the file. Simple and human-readable, but write cost grows with the list.
+class JsonFileStorage:
+    name = 'json'
+
+    def __init__(self, data_file):
+        self.data_file = data_file
+
+    def load(self):
+        return read_reminders_file(self.data_file)
+
+    def save(self, reminders):
+        # Sort reminders by time before saving for consistent order
+        reminders = sorted(reminders, key=lambda r: r.get('time', ''))
+        # Indentation keeps the file readable, it is meant to be edited by hand
+        write_json_atomic(self.data_file, reminders, indent=4)
+        logger.debug("Saved %s reminders to %s", len(reminders), self.data_file)
+
+    def write(self, changes, snapshot):
+        # Individual changes are not needed, the snapshot already contains them
+        self.save(snapshot())
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, snapshot):
+        pass
+
+    def close(self):
+        pass
+
+
+# --- Append-only journal backend ---
+# reminders.json is kept as the snapshot and every change is appended as one JSON
+# line to a journal file next to it, so a flush costs O(changes) instead of
+# O(all reminders). On startup the snapshot is loaded and the journal replayed.
+# Once the journal grows past compact_threshold_bytes, compact() rewrites the
+# snapshot and truncates the journal. Replaying a journal on top of a newer
+# snapshot is harmless because every record is idempotent, so a crash between
+# the two steps of compaction loses nothing.
+class JournalStorage:
+    name = 'journal'
+
+    def __init__(self, data_file, journal_file=None, compact_threshold_bytes=1024 * 1024):
+        self.snapshot_storage = JsonFileStorage(data_file)
+        self.journal_file = journal_file or os.path.splitext(data_file)[0] + '.journal.jsonl'
+        self.compact_threshold_bytes = compact_threshold_bytes
+        self._journal = None # Opened lazily in append mode
+
+    def load(self):
+        reminders_by_id = {}
+        for reminder in self.snapshot_storage.load():
+            # Records without an id cannot be targeted by the journal; keep them under a placeholder key
+            reminders_by_id[reminder.get('id') or object()] = reminder
+        replayed = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                        apply_changes(reminders_by_id, [self._change_from_record(record)])
+                        replayed += 1
+                    except (ValueError, KeyError, TypeError) as e:
+                        # Usually a torn last line after a crash; skip it and keep going
+                        logger.warning("Skipping unreadable journal record at %s:%s: %s", self.journal_file, line_number, e)
+        logger.info("Replayed %s journal records from %s", replayed, self.journal_file)
+        return list(reminders_by_id.values())
+
+    def save(self, reminders):
+        # A full save is a snapshot with an empty journal
+        self._close_journal()
+        self.snapshot_storage.save(reminders)
+        self._truncate_journal()
+
+    def write(self, changes, snapshot):
+        if not changes:
+            return
+        journal = self._open_journal()
+        journal.write(''.join(json.dumps(self._record_from_change(change), ensure_ascii=False) + '\n' for change in changes))
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    def needs_compaction(self):
+        try:
+            return os.path.getsize(self.journal_file) >= self.compact_threshold_bytes
+        except OSError:
+            return False
+
+    def compact(self, snapshot):
+        logger.info("Compacting journal %s into %s", self.journal_file, self.snapshot_storage.data_file)
+        self.save(snapshot())
+
+    def close(self):
+        self._close_journal()
+
+    def _open_journal(self):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+            # Terminate a torn last line left by a crash, so new records start on a line of their own
+            if self._journal.tell() > 0:
+                with open(self.journal_file, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        self._journal.write('\n')
+        return self._journal
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _truncate_journal(self):
+        with open(self.journal_file, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _record_from_change(change):
+        op, payload = change
+        if op == 'add':
+            return {'op': 'add', 'reminder': payload}
+        if op == 'delete':
+            return {'op': 'delete', 'id': payload}
+        return {'op': 'fired', 'ids': list(payload)}
+
+    @staticmethod
+    def _change_from_record(record):
+        op = record['op']
+        if op == 'add':
+            return ('add', record['reminder'])
+        if op == 'delete':
+            return ('delete', record['id'])
+        if op == 'fired':
+            return ('fired', record['ids'])
+        raise ValueError(f"Unknown journal op: {op}")
+
+
+# --- SQLite backend ---
+# Each reminder is one row keyed by id, with its normalized UTC due time in an
+# indexed column. Changes are applied with primary-key statements inside a single
+# transaction per flush. The app schedules from its in-memory heap, but the due index
+# lets tools query the database with "WHERE due_utc <= now ORDER BY due_utc LIMIT k".
+# The database runs in WAL mode so readers are not blocked while a flush writes.
+class SqliteStorage:
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS reminders (
+            id TEXT PRIMARY KEY,
+            due_utc REAL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS reminders_due_utc ON reminders (due_utc);
+    """
+    # PRAGMA user_version once reminders.json has been imported (or there was nothing to import)
+    IMPORTED_VERSION = 1
+
+    # due_key(reminder) returns the UTC due time as a POSIX timestamp (raises ValueError if unparseable)
+    def __init__(self, db_file, due_key, import_from=None):
+        self.db_file = db_file
+        self.due_key = due_key
+        self._lock = threading.Lock()
+        # The connection is shared between the flusher and request handlers, guarded by self._lock
+        self._connection = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(self.SCHEMA)
+        self._import_once(import_from)
+
+    # Migrate an existing reminders.json the first time the database is used. The migration
+    # is recorded in PRAGMA user_version, in the same transaction as the imported rows, so
+    # an empty table later on (everything deleted or fired) never brings the file back.
+    def _import_once(self, import_from):
+        with self._lock, self._transaction():
+            if self._connection.execute('PRAGMA user_version').fetchone()[0] >= self.IMPORTED_VERSION:
+                return
+            # Databases created before the version was recorded: only import into an empty one
+            is_empty = self._connection.execute('SELECT COUNT(*) FROM reminders').fetchone()[0] == 0
+            if import_from and os.path.exists(import_from) and is_empty:
+                reminders = assign_missing_ids(read_reminders_file(import_from))
+                if reminders:
+                    logger.info("Importing %s reminders from %s into %s", len(reminders), import_from, self.db_file)
+                    self._connection.executemany(
+                        'INSERT OR REPLACE INTO reminders (id, due_utc, data) VALUES (?, ?, ?)',
+                        (self._row(reminder) for reminder in reminders))
+            self._connection.execute(f'PRAGMA user_version = {self.IMPORTED_VERSION}')
+
+    def load(self):
+        with self._lock:
+            rows = self._connection.execute('SELECT data FROM reminders').fetchall()
+        logger.info("Loaded %s reminders from %s", len(rows), self.db_file)
+        return [json.loads(data) for (data,) in rows]
+
+    def save(self, reminders):
+        with self._lock, self._transaction():
+            self._connection.execute('DELETE FROM reminders')
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO reminders (id, due_utc, data) VALUES (?, ?, ?)',
+                (self._row(reminder) for reminder in reminders if reminder.get('id')))
+        logger.info("Saved %s reminders to %s", len(reminders), self.db_file)
+
+    def write(self, changes, snapshot):
+        if not changes:
+            return
+        with self._lock, self._transaction():
+            for op, payload in changes:
+                if op == 'add':
+                    self._connection.execute(
+                        'INSERT OR REPLACE INTO reminders (id, due_utc, data) VALUES (?, ?, ?)', self._row(payload))
+                elif op == 'delete':
+                    self._connection.execute('DELETE FROM reminders WHERE id = ?', (payload,))
+                elif op == 'fired':
+                    self._connection.executemany('DELETE FROM reminders WHERE id = ?', ((i,) for i in payload))
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM reminders').fetchone()[0]
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, snapshot):
+        pass
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _row(self, reminder):
+        try:
+            due_utc = self.due_key(reminder)
+        except (ValueError, TypeError):
+            due_utc = None # Unparseable times are stored without a due time
+        return (reminder['id'], due_utc, json.dumps(reminder, ensure_ascii=False))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # Caller holds self._lock
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+
+
+STORAGE_BACKENDS = ('json', 'journal', 'sqlite')
+
+
+# Create the storage backend selected by name
+# due_key is only used by the sqlite backend (see SqliteStorage)
+def create_storage(name, data_file, journal_compact_bytes=1024 * 1024, sqlite_file=None, due_key=None):
+    if name == 'json':
+        return JsonFileStorage(data_file)
+    if name == 'journal':
+        return JournalStorage(data_file, compact_threshold_bytes=journal_compact_bytes)
+    if name == 'sqlite':
+        return SqliteStorage(sqlite_file or os.path.splitext(data_file)[0] + '.db', due_key, import_from=data_file)
+    raise ValueError(f"Unknown storage backend '{name}'. Expected one of: {', '.join(STORAGE_BACKENDS)}")
+
+
+# One-shot importer: copy a reminders.json file into a SQLite database
+#   python storage.py import-json reminders.json reminders.db
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reminder storage tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import-json', help='Import a reminders.json file into a SQLite database')
+    import_parser.add_argument('json_file', help='Path to reminders.json')
+    import_parser.add_argument('db_file', help='Path to the SQLite database (created if missing)')
+    import_parser.add_argument('--replace', action='store_true', help='Remove reminders already in the database first')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+
+    if args.command == 'import-json':
+        reminders = assign_missing_ids(read_reminders_file(args.json_file))
+        storage = SqliteStorage(args.db_file, reminder_due_timestamp)
+        try:
+            if args.replace:
+                storage.save(reminders)
+            else:
+                storage.write([('add', reminder) for reminder in reminders], None)
+            print(f"Database {args.db_file} now holds {storage.count()} reminders.")
+        finally:
+            storage.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())